@@ -0,0 +1,92 @@
+## Asset manager that loads the images and fonts of the game only once
+#
+# pygame is imported on the first load rather than with this module, so
+# importing the game does not start pygame
+
+import os
+import time
+from collections import OrderedDict
+
+# Assets are looked up next to this file, so the game can be started from any directory
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Assets:
+    """Loads images and fonts once and hands out shared references to them"""
+
+    def __init__(self, asset_dir=ASSET_DIR):
+        self.asset_dir = asset_dir
+        self.images = {}                    # (filename, alpha) -> converted surface
+        self.fonts = {}                     # (name, size) -> font
+        self.font_paths = {}                # name -> font file, None for the default font
+        self.load_time = 0.0                # total seconds spent loading assets
+
+    def path(self, filename):
+        """Returns the full path of an asset file"""
+        return os.path.join(self.asset_dir, filename)
+
+    def load_image(self, filename, alpha=False):
+        """Loads an image and converts it to the display format for fast
+        blitting. Needs the display mode to be set before the first call"""
+        key = (filename, alpha)
+        if key not in self.images:
+            import pygame
+            start = time.perf_counter()
+            image = pygame.image.load(self.path(filename))
+            self.images[key] = image.convert_alpha() if alpha else image.convert()
+            self.load_time += time.perf_counter() - start
+        return self.images[key]
+
+    def load_font(self, name, size):
+        """Loads a system font of the given size. The font file is looked up
+        once per name, falling back to the default font of pygame like
+        SysFont does if the system has no such font"""
+        key = (name, size)
+        if key not in self.fonts:
+            import pygame
+            start = time.perf_counter()
+            if name not in self.font_paths:
+                self.font_paths[name] = pygame.font.match_font(name)
+            self.fonts[key] = pygame.font.Font(self.font_paths[name], size)
+            self.load_time += time.perf_counter() - start
+        return self.fonts[key]
+
+    def report(self):
+        """Returns a short summary of what was loaded and how long it took"""
+        return (f"Loaded {len(self.images)} images and {len(self.fonts)} fonts "
+                f"in {self.load_time*1000:.1f} ms")
+
+
+class GlyphCache:
+    """Bounded LRU cache of rendered text surfaces, keyed on font, text,
+    colour and alpha, so unchanged text is never rendered twice"""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()       # (font, text, color, alpha) -> surface
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, alpha=None):
+        """Returns the rendered text, only rendering it on a cache miss.
+        The returned surface is shared and must not be modified"""
+        key = (font, text, color, alpha)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, True, color)
+        if alpha is not None:
+            surface.set_alpha(alpha)
+
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.maxsize:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def report(self):
+        """Returns a short summary of the cache hits and misses"""
+        return f"Glyph cache: {self.hits} hits, {self.misses} misses, {len(self.surfaces)} cached"
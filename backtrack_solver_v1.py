@@ -1,6 +1,7 @@
 ## My initial attempt at a Sudoku solver for text only
 
 import numpy as np
+import sudoku_solver
 
 testgrid = np.array([[0,1,0,0,3,0,9,0,2],
                     [0,0,0,0,0,2,0,1,0],
@@ -47,13 +48,16 @@ def col_check(grid, N):
 
 def box_check(grid, M, N):
     """Given a M x N grid, rownumber M and columnnumber N, returns True/False depending
-     on if there are multiple of the same number in the corresponding 3x3 box."""
+     on if there are multiple of the same number in the corresponding box. The boxes
+     of an n^2 x n^2 grid are n x n, so 3x3 for a 9x9 grid."""
 
-    M = (M // 3)*3
-    N = N // 3
+    size = len(grid)
+    n = sudoku_solver.box_size(grid)
+    M = (M // n)*n
+    N = N // n
 
     # Recreating the corresponding block from coordinates M and N, flattening it and removing any 0 entries
-    block = grid.reshape(27,3)[N + 3*M : N + 9 + 3*M : 3].flatten()
+    block = grid.reshape(size*n, n)[N + n*M : N + size + n*M : n].flatten()
     block = block[block != 0]
 
     # Check if there is more than 1 of the same number
@@ -63,42 +67,148 @@ def box_check(grid, M, N):
             return False
     return True
 
+## Batch version of the three checks for many grids at once ##
+# Every number k is turned into the bit 1 << k. Adding up the bits of a row, column or
+# box gives the same as OR-ing them exactly when no number appears twice in it.
+# Numbers above the grid size or below 0 map to bit 0, which marks the unit as broken.
+
+def number_bits(size):
+    """Returns the table that turns the numbers 0-255 into their bits for grids of
+     size x size, in the smallest unsigned type that holds all of them."""
+
+    dtype = np.uint16 if size < 16 else np.uint32
+    return np.array([0] + [1 << k for k in range(1, size + 1)] + [1]*(255 - size), dtype=dtype)
+
+NUMBER_BITS = number_bits(9)
+
+def unit_reduce(bits, op):
+    """Given an N x n^2 x n^2 array and a numpy ufunc, combines the cells of every
+     row, column and box with it and returns the results as an N x 3 x n^2 array."""
+
+    size = bits.shape[-1]
+    n = int(round(size ** 0.5))
+    rows = op.reduce(bits, axis=2)
+    cols = op.reduce(bits, axis=1)
+
+    # Combining the columns and then the rows of each box. Combining the slices one by
+    # one is faster than op.reduce over these short axes
+    blocks = bits.reshape(-1, n, n, n, n)
+    box_rows = blocks[:, :, :, :, 0]
+    for k in range(1, n):
+        box_rows = op(box_rows, blocks[:, :, :, :, k])
+    boxes = box_rows[:, :, 0]
+    for k in range(1, n):
+        boxes = op(boxes, box_rows[:, :, k])
+    boxes = boxes.reshape(-1, size)
+
+    return np.stack((rows, cols, boxes), axis=1)
+
+def batch_check(grids, complete=False):
+    """Given an N x n^2 x n^2 array of grids (N x 9 x 9 for classic sudokus), returns
+     a length N boolean array that is True for every grid obeying all three rules,
+     and an N x 3 x n^2 boolean array marking the offending rows, columns and boxes
+     (in that order) of every grid. Zero entries count as empty unless complete is
+     True, in which case every unit must contain each number exactly once."""
+
+    grids = np.asarray(grids)
+    size = grids.shape[-1]
+    if grids.dtype != np.uint8:
+        # Numbers outside 0-size become 255 before the cast, which would wrap 257 to 1
+        grids = np.where((grids >= 0) & (grids <= size), grids, 255).astype(np.uint8)
+    table = NUMBER_BITS if size == 9 else number_bits(size)
+    bits = table[grids]
+    unit_or = unit_reduce(bits, np.bitwise_or)
+    unit_sum = unit_reduce(bits, np.add)
+
+    bad_units = (unit_sum != unit_or) | (unit_or & 1).astype(bool)
+    if complete:
+        bad_units |= unit_or != sudoku_solver.layout(int(round(size ** 0.5))).all_digits
+
+    valid = ~bad_units.any(axis=(1, 2))
+    return valid, bad_units
+
 ## Backtracking algorithm ##
 # Filling in a number and testing if it is valid. If not then go back and try the next number.
+# The numbers used in every row, column and box are kept as bitmasks that are updated
+# whenever a cell changes, so testing a number never has to rescan the grid.
+# It runs its own search rather than calling the engine in sudoku_solver, so it stays
+# the plain backtracking baseline that benchmark.py measures in steps per second.
 
-def backtrack(grid):
-    """Solves any given 9x9 grid of solvable sudoku."""
+def backtrack(grid, stats=None):
+    """Solves any given n^2 x n^2 grid of solvable sudoku, such as 9x9 or 16x16.
+    Passing a SolverStats object counts the values tried and taken back in it."""
 
-    # Copying over the grid, flattening it and finding all indices that have a zero entry
-    solved_grid = grid.copy().flatten()
-    empty_spaces = np.where(solved_grid.flatten() == 0)[0]
+    # Lookup tables for the row, column and box of every cell of a grid this size
+    grid = np.asarray(grid)
+    tables = sudoku_solver.layout(sudoku_solver.box_size(grid))
+    size = tables.size
 
-    # Starting the algorithm. i corresponds to the ith cell of a flattened sudoku array
+    # Copying over the grid, flattening it and finding all indices that have a zero entry
+    solved_grid = [int(value) for value in grid.flatten()]
+    empty_spaces = [i for i in range(tables.ncells) if solved_grid[i] == 0]
+
+    # Row, column and box of every empty cell, looked up once
+    Ms = [tables.row_of[e] for e in empty_spaces]
+    Ns = [tables.col_of[e] for e in empty_spaces]
+    Bs = [tables.box_of[e] for e in empty_spaces]
+
+    # Bitmasks of the numbers already used in every row, column and box
+    rows, cols, boxes = [0]*size, [0]*size, [0]*size
+    for i, value in enumerate(solved_grid):
+        if value != 0:
+            bit = 1 << value
+            M, N, B = tables.row_of[i], tables.col_of[i], tables.box_of[i]
+            if value > size or (rows[M] | cols[N] | boxes[B]) & bit:
+                raise ValueError("The given grid has no solution")
+            rows[M] |= bit
+            cols[N] |= bit
+            boxes[B] |= bit
+
+    # Starting the algorithm. i corresponds to the ith empty cell of the flattened sudoku
     i = 0
+    tried = backtracks = 0
     while i != len(empty_spaces):
 
         empty_space = empty_spaces[i]
-        M = empty_space // 9
-        N = empty_space % 9
-
-        # Adding 1 to the value in the current cell.
-        solved_grid[empty_space] = solved_grid[empty_space] + 1
-
-        # Checking if all rules are obeyed and if the value in the cell is not more than 9. If valid, go to the next cell
-        if row_check(solved_grid.reshape(9,9), M) and col_check(solved_grid.reshape(9,9), N) \
-            and box_check(solved_grid.reshape(9,9), M, N) and solved_grid[empty_space] >= 10:
+        M, N, B = Ms[i], Ns[i], Bs[i]
+        value = solved_grid[empty_space]
+
+        # Taking the current value out of the tables before trying the next one
+        if value != 0:
+            bit = ~(1 << value)
+            rows[M] &= bit
+            cols[N] &= bit
+            boxes[B] &= bit
+
+        # Adding 1 to the value in the current cell until it obeys all rules
+        used = rows[M] | cols[N] | boxes[B]
+        value = value + 1
+        while value <= size and used & (1 << value):
+            value = value + 1
+
+        # If a valid value is found, store it and go to the next cell
+        if value <= size:
+            solved_grid[empty_space] = value
+            bit = 1 << value
+            rows[M] |= bit
+            cols[N] |= bit
+            boxes[B] |= bit
             i = i + 1
-            continue
+            tried = tried + 1
+
+        # If no number up to the grid size is valid, reset the cell to 0 and go back one cell
         else:
-            # If current cellvalue is 9 and we are not at the 1st cell, reset the cell to 0 and go back one cell
-            if solved_grid[empty_space] >= 9 and i != 0:            
-                solved_grid[empty_space] = 0
-                i = i - 1
-                continue
-            # If current cellvalue is not yet 9, but still no valid entry the loop starts again
-            else:
-                continue
-
-    return solved_grid.reshape(9,9)
-
-print(backtrack(testgrid))
\ No newline at end of file
+            solved_grid[empty_space] = 0
+            i = i - 1
+            backtracks = backtracks + 1
+            if i < 0:
+                raise ValueError("The given grid has no solution")
+
+    if stats is not None:
+        stats.nodes += tried
+        stats.candidates_tried += tried
+        stats.backtracks += backtracks
+    return np.array(solved_grid, dtype=grid.dtype).reshape(size, size)
+
+if __name__ == '__main__':
+    print(backtrack(testgrid))
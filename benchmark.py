@@ -0,0 +1,339 @@
+## Benchmark suite for the solvers of this project
+#
+#   python benchmark.py                          run every solver on every puzzle set
+#   python benchmark.py --json results.json      also write the results as JSON
+#   python benchmark.py --compare results.json   compare against an earlier JSON run
+#   python benchmark.py --no-memory              skip the slow peak memory runs
+#   python benchmark.py --legacy                 compare backtrack with its original version
+#
+# Every solver runs headlessly on the embedded puzzle sets. The wall time is the
+# best of a few runs, the peak memory comes from a separate run under tracemalloc.
+# Nodes and backtracks come from another run that collects SolverStats. Board.solve
+# hands the search to the solver engine, so it reports the counters of the engine.
+# Naive backtracking only runs on the 9x9 sets.
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+import sudoku_solver
+import dlx_solver
+from backtrack_solver_v1 import testgrid, row_check, col_check, box_check, backtrack
+
+PUZZLE_SETS = {
+    'repo': [
+        ('testgrid', ''.join(str(v) for v in testgrid.flatten())),
+    ],
+    'easy': [
+        ('easy_1', '030004060000000570004509010106000000300007108700830052920003000008000000000025000'),
+        ('easy_2', '050360000008002306004810092023000178000000003071400000007080000080104600000025000'),
+        ('easy_3', '000700000008004020901000045000020600764100030023800500810073000006008007000000090'),
+        ('easy_4', '002048000007206310008030900000000683010002004003050200000004876200060000000000000'),
+    ],
+    'medium': [
+        ('medium_1', '030000060000000504004509010106000000300047108700830002920003000008000000000025000'),
+        ('medium_2', '000300000008002306004010092023050108060000003071400000007080000000104600000025000'),
+        ('medium_3', '000700000008004000901000045000020600764100030003800000810003000206008007000000090'),
+        ('medium_4', '000048000007206310000030900000000683010002004003050001000004876200060000080000000'),
+    ],
+    'hard': [
+        ('hard_1', '860005200090000075007009000000100600400020000050008000000030002900006100604800000'),
+        ('hard_2', '000360000008002300004010092020050178000000003071400060007080000080104600000025000'),
+        ('hard_3', '050600000000000028907003000070905080060000070400086005800000003000000200205409000'),
+        ('hard_4', '010006080007090005004000090390007600070204000000000100040008000000050060000060002'),
+    ],
+    'hardest': [
+        ('arto_inkala', '800000000003600000070090200050007000000045700000100030001000068008500010090000400'),
+        ('easter_monster', '100000002090400050006000700050903000000070000000850040700000600030009080002000001'),
+        ('ai_escargot', '100007090030020008009600500005300900010080002600004000300000010040000007007000300'),
+        ('platinum_blonde', '000000012000000003002300400001800005060070800000009000008500000900040500470006000'),
+    ],
+    # Bigger grids hold the values 10 and up as the letters A-P
+    '16x16': [
+        ('medium16_1', '0900000B00000AD0007000600923005402C000A0006D7G000054C2080FG0E3006D0C000980000F00'
+                       '08004G300D900000G0A00010004000081000008D050E9040040060E0000C00053000A000B40007F0'
+                       '00E000000200083A07BF85D0EA0600000000300000000107C000040E000030B05000B0000E02G0A0'
+                       'B0300090700G0062'),
+        ('medium16_2', '80900046100000000C0G000060000AE000B0572D0A0080090070E0C000GF0B0200000037000500C0'
+                       '0A00100B00846DF000C008000003070E04000000000000005F01B000002C9030A0300C100050000G'
+                       '400E000000FG00A800080F0070E00205000B00014600D0970906C0E00510000001G0050020000000'
+                       '000500B4G0080601'),
+        ('medium16_3', '00300000700G00007000030F8A00000C00409C18000000600E2B000000C000058000A000007500D0'
+                       '1A00000000E6G080000E00600100C0A320064000FD0B0700090G0500000020FD00010G0030007040'
+                       '32000B7C040DE00ADB8F003A000000000000000D00903G70G000502908F700040090C0000000D102'
+                       '05B00000AG0100C0'),
+        ('medium16_4', '0G0900420000E0000000007540C0000306A70G13000D00020E40A0F002010D000000B7000D50030F'
+                       '000001000006700G0C64903008000B00080000AF0039005020080C01G00000B000000E5D000B0000'
+                       'G91E00000A000007000D0900F0E0010660F080000G000E0B009000045103000A00500DCE0040G000'
+                       '84GA000000B0000D'),
+    ],
+    # A minimal 16x16 puzzle that needs a lot of guessing
+    'hard16x16': [
+        ('minimal16_1', '3509200DF0000080002007BE0005F00004000000090GDA00000C5000001E00000AF0300000000060'
+                        '0000800C40900BAE0090700B01F00200800B0G00E0025F00G002D500070040060803960A00000G75'
+                        '0C100B00G2A0E000000D100000E62000000004530070B8005B00CA69040030000DG00002000F0000'
+                        '00000000000C9004'),
+    ],
+    '25x25': [
+        ('medium25_1', 'I0F0000000A0000N0800000006K10730N00F00P00000B000002H0004050000IGD090OEL7000003090'
+                       '000P10J000000C5FA0600000FHK000NC000L0003JI044C0B30F0LJ0D00000HE7P000K90000000000L'
+                       '0NMF0060I00C00J00N00IOC06000A010300M0G0G0F0007000BK0E4890200O00000DIH0000087020P0'
+                       'C0400AN000300907402000MJO000GP001960J5030000FO0000700000M0BOG0600D000080C00010940'
+                       '0A5C00L8EK100900200B0JN060FEH00A00J00M000D0000K8500000E0000P00109N0DB0H0500A030C0'
+                       '00H0600E2I0KA000O09000AID80F0B300000260901E0P00200D100O60M4K0F0N0C0JI0N0JL000A4E0'
+                       '0G0001000B0000000850MCNGE00300IJ04H0B000000O7000980000000HM0K0GC0FM000020AGI000E0'
+                       '00L1P035LN00HOI08000000100GD0AF000700EJ003500O00K0NA0000M0'),
+    ],
+}
+
+# Largest grid every solver is run on, naive backtracking takes far too long on bigger ones
+MAX_SIZE = {'backtrack': 9}
+
+
+def to_grid(text):
+    """Turns a puzzle of 81, 256 or 625 characters into a list of lists"""
+    size = int(round(len(text) ** 0.5))
+    return [[int(text[r*size + c], 36) for c in range(size)] for r in range(size)]
+
+
+def run_engine(grid, stats=None):
+    """The bitmask engine in sudoku_solver"""
+    return sudoku_solver.solve(grid, stats)
+
+
+def run_dlx(grid, stats=None):
+    """The dancing links solver in dlx_solver"""
+    return dlx_solver.solve(grid, stats)
+
+
+def run_backtrack(grid, stats=None):
+    """The iterative backtracking solver in backtrack_solver_v1"""
+    return backtrack(np.array(grid), stats).tolist()
+
+
+def run_board(grid, stats=None):
+    """Board.solve of the GUI, on a board without a window"""
+    import sudoku_gui
+    board = sudoku_gui.Board(None, grid, len(grid), len(grid), 720, 720)
+    board.solve(stats)
+    return board.model
+
+
+def available_solvers():
+    """Returns the solvers that can run here. Board.solve needs pygame, which
+    is started with a dummy video driver so no window is opened"""
+    solvers = {'engine': run_engine, 'dlx': run_dlx, 'backtrack': run_backtrack}
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    try:
+        import sudoku_gui
+        sudoku_gui.init_pygame()
+    except ImportError:
+        print("pygame is not available, skipping Board.solve", file=sys.stderr)
+    else:
+        solvers['board'] = run_board
+    return solvers
+
+
+def measure(run, grid, repeat, memory=True):
+    """Runs a solver on a puzzle and returns its result record"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        solution = run(grid)
+        times.append(time.perf_counter() - start)
+
+    # The counters come from a run of their own too, so that collecting
+    # them never shows up in the wall time
+    stats = sudoku_solver.SolverStats()
+    run(grid, stats)
+
+    # tracemalloc slows the solvers down a lot, so it gets a run of its own
+    peak = None
+    if memory:
+        tracemalloc.start()
+        run(grid)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return solution, dict(wall_time=min(times), peak_memory=peak,
+                          nodes=stats.nodes, backtracks=stats.backtracks)
+
+
+def git_commit():
+    """Returns the current git commit, or None outside of a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(solvers, sets, repeat, memory=True):
+    """Runs every solver on every puzzle of the given sets"""
+    results = []
+    for set_name in sets:
+        for puzzle_name, text in PUZZLE_SETS[set_name]:
+            grid = to_grid(text)
+            expected = sudoku_solver.solve(grid)
+            for solver_name, run in solvers.items():
+                if len(grid) > MAX_SIZE.get(solver_name, len(grid)):
+                    continue
+                solution, record = measure(run, grid, repeat, memory)
+                if solution != expected:
+                    raise AssertionError(f"{solver_name} gave a wrong solution for {puzzle_name}")
+                results.append(dict(solver=solver_name, set=set_name, puzzle=puzzle_name, **record))
+    return results
+
+
+def summarize(results):
+    """Returns the total wall time, nodes and backtracks per solver and set"""
+    summary = {}
+    for record in results:
+        key = f"{record['solver']}/{record['set']}"
+        total = summary.setdefault(key, {'wall_time': 0.0, 'nodes': 0, 'backtracks': 0, 'peak_memory': 0})
+        total['wall_time'] += record['wall_time']
+        for counter in ('nodes', 'backtracks', 'peak_memory'):
+            if record[counter] is None or total[counter] is None:
+                total[counter] = None
+            else:
+                total[counter] += record[counter]
+    return summary
+
+
+def print_summary(summary, baseline=None):
+    """Prints the summary as a table, with the speed ratio to a baseline run"""
+    header = f"{'solver/set':<20} {'time (s)':>10} {'nodes':>9} {'backtracks':>11} {'peak mem (kB)':>14}"
+    if baseline is not None:
+        header += f" {'vs baseline':>12}"
+    print(header)
+
+    for key, total in summary.items():
+        nodes = '-' if total['nodes'] is None else total['nodes']
+        backtracks = '-' if total['backtracks'] is None else total['backtracks']
+        memory = '-' if total['peak_memory'] is None else f"{total['peak_memory'] / 1024:.1f}"
+        line = f"{key:<20} {total['wall_time']:>10.4f} {nodes:>9} {backtracks:>11} {memory:>14}"
+        if baseline is not None:
+            old = baseline.get(key)
+            line += f" {old['wall_time'] / total['wall_time']:>11.2f}x" if old else f" {'new':>12}"
+        print(line)
+
+
+# Puzzles that the legacy solver still finishes within a few seconds
+LEGACY_PUZZLES = {
+    'testgrid': testgrid,
+    'medium': np.array([int(c) for c in
+        '040300825060090000005800100010400003400600050576900080001530700000000500000060238']).reshape(9,9),
+    'hard': np.array([int(c) for c in
+        '200630000001020007006100090100900000408000009009040280000700053032068040700010928']).reshape(9,9),
+}
+
+
+def legacy_backtrack(grid):
+    """The original backtrack, which reshapes and rechecks the whole row, column
+    and box on every step. Returns the solved grid and the number of steps"""
+
+    solved_grid = grid.copy().flatten()
+    empty_spaces = np.where(solved_grid.flatten() == 0)[0]
+
+    steps = 0
+    i = 0
+    while i != len(empty_spaces):
+        steps += 1
+
+        empty_space = empty_spaces[i]
+        M = empty_space // 9
+        N = empty_space % 9
+
+        solved_grid[empty_space] = solved_grid[empty_space] + 1
+
+        if row_check(solved_grid.reshape(9,9), M) and col_check(solved_grid.reshape(9,9), N) \
+            and box_check(solved_grid.reshape(9,9), M, N) and solved_grid[empty_space] <= 9:
+            i = i + 1
+            continue
+        else:
+            if solved_grid[empty_space] >= 9 and i != 0:
+                solved_grid[empty_space] = 0
+                i = i - 1
+                continue
+            else:
+                continue
+
+    return solved_grid.reshape(9,9), steps
+
+
+def best_time(func, grid, repeat):
+    """Returns the fastest of repeat runs of func(grid) in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(grid)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare_legacy():
+    """Compares backtrack with its original numpy implementation"""
+    print(f"{'puzzle':<10} {'steps':>9} {'before (s)':>11} {'after (s)':>10} "
+          f"{'before steps/s':>15} {'after steps/s':>14} {'speedup':>8}")
+
+    for name, grid in LEGACY_PUZZLES.items():
+        legacy_solution, steps = legacy_backtrack(grid)
+        assert (legacy_solution == backtrack(grid)).all()
+
+        before = best_time(legacy_backtrack, grid, 1)
+        after = best_time(backtrack, grid, 5)
+        print(f"{name:<10} {steps:>9} {before:>11.4f} {after:>10.4f} "
+              f"{steps / before:>15.0f} {steps / after:>14.0f} {before / after:>7.0f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sudoku solvers")
+    parser.add_argument('--json', help="file to write the results to as JSON")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare against")
+    parser.add_argument('--solvers', nargs='+', help="solvers to run (default: all available)")
+    parser.add_argument('--sets', nargs='+', choices=PUZZLE_SETS, default=list(PUZZLE_SETS),
+                        help="puzzle sets to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per puzzle, the best is kept (default: 3)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the peak memory runs, which are slow")
+    parser.add_argument('--legacy', action='store_true', help="compare backtrack with its original version")
+    args = parser.parse_args(argv)
+
+    if args.legacy:
+        compare_legacy()
+        return
+
+    solvers = available_solvers()
+    if args.solvers:
+        solvers = {name: solvers[name] for name in args.solvers}
+
+    results = run_suite(solvers, args.sets, args.repeat, not args.no_memory)
+    summary = summarize(results)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['summary']
+    print_summary(summary, baseline)
+
+    if args.json:
+        report = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': args.repeat,
+            'results': results,
+            'summary': summary,
+        }
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+## Dancing Links (Knuth's Algorithm X) exact-cover solver
+#
+# A sudoku is an exact cover problem: every cell, every digit of a row, every
+# digit of a column and every digit of a box must be covered exactly once, and
+# placing digit d in a cell covers four of these constraints. The constraint
+# matrix only depends on the grid size, so it is built once per size and every
+# puzzle is solved on the same node arena. The givens are covered before the
+# search and uncovered afterwards, which leaves the arena as it was.
+
+import time
+
+import sudoku_solver
+
+
+class DancingLinks:
+    """Exact cover solver for n^2 x n^2 sudokus. The links of the nodes are
+    kept in flat lists indexed by node number, node 0 is the root and nodes
+    1 to the number of constraints are the column headers"""
+
+    def __init__(self, box=3, max_nodes=None):
+        size = box*box
+        self.box = box
+        self.size = size
+        self.ncols = 4*size*size            # cell, row, column and box constraints
+        self.nodes = 0                      # number of rows tried by the last search
+        self.max_nodes = float('inf') if max_nodes is None else max_nodes
+        self.stats = None                   # SolverStats filled by the search, if any
+
+        # The root and the column headers form one circular list
+        count = self.ncols + 1
+        self.L = [i - 1 for i in range(count)]
+        self.R = [i + 1 for i in range(count)]
+        self.L[0], self.R[-1] = self.ncols, 0
+        self.U = list(range(count))
+        self.D = list(range(count))
+        self.C = list(range(count))         # column header of every node
+        self.S = [0]*count                  # number of nodes in every column
+        self.row_of = [-1]*count            # matrix row of every node
+        self.first = []                     # first node of every matrix row
+
+        # Matrix row (r*size + c)*size + d - 1 places digit d in row r, column c
+        for r in range(size):
+            for c in range(size):
+                b = (r // box)*box + c // box
+                for d in range(size):
+                    columns = (1 + r*size + c,
+                               1 + size*size + r*size + d,
+                               1 + 2*size*size + c*size + d,
+                               1 + 3*size*size + b*size + d)
+                    self.add_row(columns)
+
+    def add_row(self, columns):
+        """Appends a matrix row with a node in each of the given columns"""
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        row = len(self.first)
+        start = len(L)
+        self.first.append(start)
+        for k, column in enumerate(columns):
+            node = start + k
+            L.append(start + (k - 1) % len(columns))
+            R.append(start + (k + 1) % len(columns))
+            U.append(U[column])
+            D.append(column)
+            C.append(column)
+            self.row_of.append(row)
+            D[U[column]] = node
+            U[column] = node
+            S[column] += 1
+
+    def cover(self, c):
+        """Removes column c and every row that has a node in it"""
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        L[R[c]] = L[c]
+        R[L[c]] = R[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                U[D[j]] = U[j]
+                D[U[j]] = D[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(self, c):
+        """Puts column c and its rows back, in the reverse order of cover"""
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                U[D[j]] = j
+                D[U[j]] = j
+                j = L[j]
+            i = U[i]
+        L[R[c]] = c
+        R[L[c]] = c
+
+    def select(self, node):
+        """Covers the other columns of the row of a node whose column is covered"""
+        j = self.R[node]
+        while j != node:
+            self.cover(self.C[j])
+            j = self.R[j]
+
+    def deselect(self, node):
+        """Undoes select, uncovering the columns in reverse order"""
+        j = self.L[node]
+        while j != node:
+            self.uncover(self.C[j])
+            j = self.L[j]
+
+    def search(self, grid):
+        """Yields every solution of a grid as a flat list of values. The
+        givens are covered first; a grid whose givens break a rule has no
+        solutions. Closing the generator early restores the links as well"""
+        cells = [int(value) for row in grid for value in row]
+        size = self.size
+        if len(cells) != size*size:
+            raise ValueError(f"Expected a {size}x{size} grid, got {len(cells)} cells")
+
+        self.nodes = 0
+        stats = self.stats
+        givens = []
+        chosen = []
+        try:
+            # A given whose column is already covered repeats a digit
+            for i, value in enumerate(cells):
+                if value == 0:
+                    continue
+                if not 1 <= value <= size:
+                    return
+                node = self.first[i*size + value - 1]
+                j = node
+                while True:
+                    c = self.C[j]
+                    if self.L[self.R[c]] != c:
+                        return
+                    j = self.R[j]
+                    if j == node:
+                        break
+                self.cover(self.C[node])
+                self.select(node)
+                givens.append(node)
+
+            yield from self.explore(cells, chosen, stats)
+        finally:
+            for node in reversed(chosen):
+                self.deselect(node)
+                self.uncover(self.C[node])
+            for node in reversed(givens):
+                self.deselect(node)
+                self.uncover(self.C[node])
+
+    def explore(self, cells, chosen, stats):
+        """Algorithm X without recursion. chosen holds the row node picked at
+        every level, so the caller can unwind it if the search is stopped"""
+        L, R, D, C, S = self.L, self.R, self.D, self.C, self.S
+        size = self.size
+        while True:
+            # Every column covered means the chosen rows are a solution
+            if R[0] == 0:
+                solution = cells[:]
+                for node in chosen:
+                    row = self.row_of[node]
+                    solution[row // size] = row % size + 1
+                yield solution
+                node = 0
+
+            # Otherwise branch on the column with the fewest rows left
+            else:
+                c = R[0]
+                best, fewest = c, S[c]
+                while c != 0 and fewest > 1:
+                    if S[c] < fewest:
+                        best, fewest = c, S[c]
+                    c = R[c]
+                self.cover(best)
+                node = D[best]
+                if node == best:
+                    self.uncover(best)
+                    node = 0
+
+            # A picked row goes one level deeper
+            if node:
+                self.select(node)
+                chosen.append(node)
+                self.count_node(stats, len(chosen))
+                continue
+
+            # Dead end or solution: take back rows until one has a next row to try
+            while chosen:
+                node = chosen.pop()
+                self.deselect(node)
+                if stats is not None:
+                    stats.backtracks += 1
+                column = C[node]
+                node = D[node]
+                if node != column:
+                    self.select(node)
+                    chosen.append(node)
+                    self.count_node(stats, len(chosen))
+                    break
+                self.uncover(column)
+            else:
+                return
+
+    def count_node(self, stats, depth):
+        """Counts a picked row. Raises SearchLimitExceeded once more than
+        max_nodes rows were picked, after the row is on the chosen stack so
+        that the links are still restored"""
+        self.nodes += 1
+        if stats is not None:
+            stats.nodes += 1
+            stats.candidates_tried += 1
+            stats.max_depth = max(stats.max_depth, depth)
+        if self.nodes > self.max_nodes:
+            raise sudoku_solver.SearchLimitExceeded(f"Gave up after {self.max_nodes} search nodes")
+
+    def solutions(self, grid):
+        """Yields every solution of a grid as a list of lists"""
+        for cells in self.search(grid):
+            yield [cells[r*self.size : (r+1)*self.size] for r in range(self.size)]
+
+    def solve(self, grid):
+        """Returns the first solution of a grid as a list of lists, or None"""
+        found = self.solutions(grid)
+        try:
+            return next(found, None)
+        finally:
+            found.close()
+
+    def count(self, grid, limit=None):
+        """Counts the solutions of a grid, stopping at limit if it is given"""
+        found = self.search(grid)
+        total = 0
+        try:
+            for _ in found:
+                total += 1
+                if limit is not None and total >= limit:
+                    break
+        finally:
+            found.close()
+        return total
+
+
+# One solver per grid size, so the node arena is built once and reused by every
+# puzzle. A shared solver runs one search at a time, so a search has to finish or
+# be closed before the next one starts, and only one thread may use them
+engines = {}
+
+def engine(box):
+    """Returns the shared solver for grids with box x box boxes"""
+    if box not in engines:
+        engines[box] = DancingLinks(box)
+    return engines[box]
+
+
+def solve(grid, stats=None):
+    """Returns the solution of a grid as a list of lists, or None if the grid
+    has no solution. Passing a SolverStats object collects statistics of the
+    search in it, the same way as sudoku_solver.solve"""
+    dlx = engine(sudoku_solver.box_size(grid))
+    dlx.stats = stats
+    start = time.perf_counter()
+    try:
+        return dlx.solve(grid)
+    finally:
+        dlx.stats = None
+        if stats is not None:
+            stats.total_time += time.perf_counter() - start
+
+
+def iter_solutions(grid, max_nodes=None):
+    """Yields every solution of a grid as a list of lists. SearchLimitExceeded
+    is raised when the search needs more than max_nodes rows"""
+    dlx = engine(sudoku_solver.box_size(grid))
+    dlx.max_nodes = float('inf') if max_nodes is None else max_nodes
+    found = dlx.solutions(grid)
+    try:
+        yield from found
+    finally:
+        found.close()
+        dlx.max_nodes = float('inf')
+
+
+def count_solutions(grid, limit=2, max_nodes=None):
+    """Returns the number of solutions of a grid, counting no further than
+    limit (None counts them all). SearchLimitExceeded is raised when the
+    search needs more than max_nodes rows"""
+    found = iter_solutions(grid, max_nodes)
+    total = 0
+    try:
+        for _ in found:
+            total += 1
+            if limit is not None and total >= limit:
+                break
+    finally:
+        found.close()
+    return total
@@ -0,0 +1,141 @@
+## Memory-mapped puzzle libraries with constant time access to any puzzle
+#
+# Two formats are read, both with fixed size records so puzzle n starts at a
+# known offset and only its own bytes are read from disk:
+#
+#   text    one puzzle per line in the common 81 character format (0 or . for
+#           empty cells, base 36 digits for grids bigger than 9x9), all lines
+#           the same length, with \n or \r\n line ends
+#   packed  a 6 byte header (PACKED_MAGIC, version, box size) followed by one
+#           record per puzzle with 4 bits per cell, 41 bytes for a 9x9 puzzle
+#
+# The packed format holds values up to 15, so it is only written for 4x4 and
+# 9x9 puzzles.
+
+import mmap
+import struct
+
+PACKED_MAGIC = b'SDKP'
+PACKED_VERSION = 1
+PACKED_HEADER = struct.Struct('<4sBB')      # magic, version, box size
+
+# Characters of a text record and the values they stand for
+TEXT_CHARS = b'.0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+CELL_VALUES = bytes.maketrans(TEXT_CHARS, bytes([0] + list(range(36)) + list(range(10, 36))))
+
+
+class PuzzleLibrary:
+    """Read-only view of a puzzle library file. The file is memory-mapped,
+    so opening it does not read it and library[n] only touches the bytes of
+    puzzle n, no matter how many millions of puzzles the file holds"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"Puzzle library {path} is empty")
+
+        if self.map[:len(PACKED_MAGIC)] == PACKED_MAGIC:
+            self.open_packed()
+        else:
+            self.open_text()
+
+    def open_packed(self):
+        """Reads the header of a packed library"""
+        _, version, box = PACKED_HEADER.unpack_from(self.map)
+        if version != PACKED_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported packed library version {version} in {self.path}")
+        if box < 2 or box*box > 15:
+            self.close()
+            raise ValueError(f"Unsupported box size {box} in packed library {self.path}")
+        self.packed = True
+        self.box = box
+        self.size = box*box
+        self.ncells = self.size*self.size
+        self.offset = PACKED_HEADER.size    # start of the first record
+        self.record = (self.ncells + 1) // 2
+        self.count = (len(self.map) - self.offset) // self.record
+
+    def open_text(self):
+        """Works out the record length of a text library from its first line"""
+        end = self.map.find(b'\n')
+        line = self.map[:end if end != -1 else len(self.map)].rstrip(b'\r')
+        box = int(round(len(line) ** 0.25))
+        if box < 2 or box**4 != len(line):
+            self.close()
+            raise ValueError(f"Expected lines of n^4 characters such as 81 in {self.path}, got {len(line)}")
+
+        self.packed = False
+        self.box = box
+        self.size = box*box
+        self.ncells = len(line)
+        self.offset = 0
+        self.record = len(self.map) if end == -1 else end + 1
+
+        # The last line does not need a line end
+        self.count = (len(self.map) - self.ncells) // self.record + 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, n):
+        """Returns puzzle n as a list of lists. Raises IndexError if there is
+        no such puzzle and ValueError if its record is damaged"""
+        if n < 0:
+            n += self.count
+        if not 0 <= n < self.count:
+            raise IndexError(f"Puzzle {n} is out of range, the library has {self.count}")
+
+        start = self.offset + n*self.record
+        if self.packed:
+            cells = []
+            for byte in self.map[start : start + self.record]:
+                cells.append(byte >> 4)
+                cells.append(byte & 15)
+            del cells[self.ncells:]
+        else:
+            text = self.map[start : start + self.ncells]
+            if len(text) != self.ncells or text.translate(None, TEXT_CHARS):
+                raise ValueError(f"Puzzle {n} of {self.path} is not a valid puzzle line")
+            cells = text.translate(CELL_VALUES)
+
+        size = self.size
+        if max(cells) > size:
+            raise ValueError(f"Puzzle {n} of {self.path} has a value above {size}")
+        return [list(cells[r*size : (r+1)*size]) for r in range(size)]
+
+    def close(self):
+        """Closes the memory map and the file"""
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def pack_puzzles(grids, path, box=3):
+    """Writes grids with box x box boxes to a packed library, 4 bits per
+    cell. Returns the number of puzzles written"""
+    if box*box > 15:
+        raise ValueError(f"Packed libraries hold values up to 15, not {box*box}x{box*box} grids")
+
+    ncells = box**4
+    count = 0
+    with open(path, 'wb') as file:
+        file.write(PACKED_HEADER.pack(PACKED_MAGIC, PACKED_VERSION, box))
+        for grid in grids:
+            cells = [value for row in grid for value in row]
+            if len(cells) != ncells:
+                raise ValueError(f"Expected {ncells} cells, got {len(cells)}")
+            if len(cells) % 2:
+                cells.append(0)
+            file.write(bytes(cells[i] << 4 | cells[i + 1] for i in range(0, len(cells), 2)))
+            count += 1
+    return count
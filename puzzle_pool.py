@@ -0,0 +1,117 @@
+## Pool of pre-generated puzzles so a new game does not have to wait for the generator
+
+import os
+import queue
+import threading
+
+# Values of a cell as saved in the pool file, so bigger grids fit one character per cell
+CELL_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+class PuzzlePool:
+    """Keeps a bounded queue of pre-generated puzzles for every difficulty
+    rank. A background thread refills a queue once it runs low, and the
+    queues can be saved to and loaded from a file between sessions"""
+
+    def __init__(self, generate, ranks, size=5, low=2, path=None):
+        self.generate = generate            # function that returns a new 9x9 grid for a rank
+        self.size = size                    # number of puzzles kept per rank
+        self.low = low                      # refill once a queue has this many or fewer
+        self.path = path                    # file the pool is saved to, None to not save
+        self.queues = {rank: queue.Queue(maxsize=size) for rank in ranks}
+        self.refill = threading.Event()     # set when a queue needs refilling
+        self.stopped = False
+        self.lock = threading.Lock()        # held while adding a puzzle, none is added once stopped
+        self.thread = None
+
+        if self.path is not None:
+            self.load()
+
+    def start(self):
+        """Starts the background thread that fills the queues"""
+        self.refill.set()
+        self.thread = threading.Thread(target=self.run, name='puzzle-pool', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the background thread and saves the remaining puzzles. The
+        thread may still be generating a puzzle after the wait for it runs
+        out, but that puzzle is dropped and never ends up in the queues"""
+        with self.lock:
+            self.stopped = True
+        self.refill.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        if self.path is not None:
+            self.save()
+
+    def get(self, rank):
+        """Returns a pre-generated puzzle of the given rank without waiting,
+        or None if there is none left"""
+        pool = self.queues.get(rank)
+        if pool is None:
+            return None
+
+        try:
+            grid = pool.get_nowait()
+        except queue.Empty:
+            grid = None
+
+        if pool.qsize() <= self.low:
+            self.refill.set()
+        return grid
+
+    def run(self):
+        """Fills every queue up to its size, then sleeps until one runs low"""
+        while not self.stopped:
+            self.refill.wait()
+            self.refill.clear()
+
+            for rank, pool in self.queues.items():
+                while not self.stopped and not pool.full():
+                    grid = self.generate(rank)
+                    with self.lock:
+                        if self.stopped:
+                            return
+                        try:
+                            pool.put_nowait(grid)
+                        except queue.Full:
+                            break
+
+    def load(self):
+        """Loads the puzzles saved in the pool file, if there is one. Every
+        line holds a rank and a puzzle with one character per cell, such
+        as 81 characters for a 9x9 puzzle"""
+        if not os.path.exists(self.path):
+            return
+
+        queues = {str(rank): pool for rank, pool in self.queues.items()}
+        with open(self.path) as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) != 2 or not parts[1].isalnum():
+                    continue
+
+                pool = queues.get(parts[0])
+                text = parts[1]
+                size = int(round(len(text) ** 0.5))
+                if pool is not None and not pool.full() and size*size == len(text):
+                    pool.put_nowait([[int(c, 36) for c in text[r*size : (r+1)*size]] for r in range(size)])
+
+    def save(self):
+        """Saves the puzzles that are left in the queues to the pool file.
+        The file is replaced in one step, so it is never left half written"""
+        lines = []
+        for rank, pool in self.queues.items():
+            while True:
+                try:
+                    grid = pool.get_nowait()
+                except queue.Empty:
+                    break
+                text = ''.join(CELL_CHARS[int(value)] for row in grid for value in row)
+                lines.append(f"{rank} {text}\n")
+
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as file:
+            file.writelines(lines)
+        os.replace(temp, self.path)
@@ -0,0 +1,90 @@
+## Saved games in a small versioned binary format
+#
+# A save file starts with a fixed header (SAVE_MAGIC, format version, box size,
+# mistakes and elapsed milliseconds) followed by a zlib compressed body with one
+# byte per cell for the puzzle and the current values, and one 32 bit mask per
+# cell for the sketched values and the candidates removed by hints. A 9x9 game
+# in progress takes about 200 bytes. Files with an unknown version are refused
+# rather than guessed at, so the format can change later.
+
+import os
+import struct
+import zlib
+
+SAVE_MAGIC = b'SDKS'
+SAVE_VERSION = 1
+SAVE_HEADER = struct.Struct('<4sBBHI')      # magic, version, box size, mistakes, elapsed ms
+
+
+class SavedGame:
+    """Everything needed to carry on with a game. Grids are flat lists of
+    cells, row by row, and masks use the bit 1 << value per value"""
+
+    def __init__(self, box, puzzle, values, marks, removed, mistakes=0, elapsed=0.0):
+        self.box = box                      # grids have box x box boxes
+        self.puzzle = puzzle                # the givens of the puzzle
+        self.values = values                # givens plus the values filled in so far
+        self.marks = marks                  # sketched values of every cell
+        self.removed = removed              # candidates removed by hints
+        self.mistakes = mistakes
+        self.elapsed = elapsed              # seconds played
+
+
+def encode_game(game):
+    """Turns a SavedGame into bytes"""
+    ncells = game.box**4
+    for cells in (game.puzzle, game.values, game.marks, game.removed):
+        if len(cells) != ncells:
+            raise ValueError(f"Expected {ncells} cells, got {len(cells)}")
+
+    header = SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, game.box, min(game.mistakes, 0xFFFF),
+                              min(int(game.elapsed*1000), 0xFFFFFFFF))
+    body = (bytes(game.puzzle) + bytes(game.values)
+            + struct.pack(f'<{ncells}I', *game.marks) + struct.pack(f'<{ncells}I', *game.removed))
+    return header + zlib.compress(body, 9)
+
+
+def decode_game(data):
+    """Turns bytes written by encode_game back into a SavedGame. Raises
+    ValueError for data that is not a saved game of a known version"""
+    if len(data) < SAVE_HEADER.size:
+        raise ValueError("Saved game is too short")
+    magic, version, box, mistakes, elapsed = SAVE_HEADER.unpack_from(data)
+    if magic != SAVE_MAGIC:
+        raise ValueError("Not a saved game")
+    if version != SAVE_VERSION:
+        raise ValueError(f"Unsupported saved game version {version}")
+    if box < 2:
+        raise ValueError(f"Saved game has a box size of {box}")
+
+    try:
+        body = zlib.decompress(data[SAVE_HEADER.size:])
+    except zlib.error as error:
+        raise ValueError(f"Saved game is damaged: {error}")
+
+    ncells = box**4
+    if len(body) != ncells*10:
+        raise ValueError(f"Saved game has {len(body)} bytes of cells, expected {ncells*10}")
+
+    puzzle, values = body[:ncells], body[ncells : 2*ncells]
+    if max(values) > box*box or any(given and given != value for given, value in zip(puzzle, values)):
+        raise ValueError("Saved game has values that do not fit its puzzle")
+
+    masks = struct.unpack_from(f'<{2*ncells}I', body, 2*ncells)
+    return SavedGame(box, list(puzzle), list(values),
+                     list(masks[:ncells]), list(masks[ncells:]), mistakes, elapsed / 1000)
+
+
+def save_game(path, game):
+    """Writes a SavedGame to a file. The file is replaced in one step, so a
+    crash while saving never leaves half a save behind"""
+    temp = path + '.tmp'
+    with open(temp, 'wb') as file:
+        file.write(encode_game(game))
+    os.replace(temp, path)
+
+
+def load_game(path):
+    """Reads a SavedGame from a file"""
+    with open(path, 'rb') as file:
+        return decode_game(file.read())
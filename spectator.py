@@ -0,0 +1,416 @@
+## Spectator mode: many boards solving at once in one window
+#
+#   python spectator.py --boards 16 --backend engine --backend dlx --backend backtrack
+#
+# The boards are laid out in a grid scaled to the window. Every board draws into
+# its own subsurface of the window. The solvers run in a pool of worker processes,
+# one per CPU core, and every worker solves its share of the boards in a thread
+# per board so they all make progress at once. The workers send the cells that changed back through a queue in batches of at most
+# BATCH_TIME seconds, with only the last value of every cell in a batch, so a
+# batch never holds more than one entry per cell however fast the solver runs.
+# Every frame only the boards that received changes are drawn.
+#
+# With more than one backend the boards race in groups: boards 1, 2 and 3 of
+# the example above solve the same puzzle, as do boards 4, 5 and 6 and so on.
+# Solvers are slowed down to --speed steps per second so the race can be
+# followed, a step being one cell that gets a value or is emptied again.
+
+import argparse
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from array import array
+
+import sudoku_solver
+import sudoku_generator
+import dlx_solver
+import sudoku_gui
+from puzzle_library import PuzzleLibrary
+
+pygame = None
+
+WINDOW = (1280, 900)
+FPS = 60
+MARGIN = 6                                  # pixels around every board
+LABEL_HEIGHT = 24                           # pixels below every board for its label
+LABEL_INTERVAL = 0.25                       # seconds between label updates of a running board
+BATCH_TIME = 1 / FPS                        # seconds of steps a worker collects before sending them
+SPEED = 200                                 # default steps per second of every solver
+WORKER_NICE = 19                            # workers run at a lower priority than the window
+WORKERS = os.cpu_count() or 1               # most worker processes, each solves several boards
+
+
+class StepStream:
+    """Collects the steps of a solver in a worker process and puts them on
+    the event queue in batches, as ('steps', board number, cell and value
+    pairs, steps so far). Steps that do not change a cell are not counted"""
+
+    def __init__(self, number, cells, events, speed=SPEED):
+        self.number = number
+        self.cells = list(cells)            # values as the solver left them
+        self.events = events
+        self.speed = speed                  # steps per second, 0 for as fast as possible
+        self.changed = {}                   # cell -> last value since the last batch
+        self.steps = 0
+        self.start = self.sent = time.perf_counter()
+
+    def __call__(self, i, value):
+        """Records that cell i got a value, 0 if it was emptied"""
+        if self.cells[i] == value:
+            return
+        self.cells[i] = value
+        self.changed[i] = value
+        self.steps += 1
+
+        # Unthrottled solvers only look at the clock every 64 steps
+        if self.speed or not self.steps & 63:
+            now = time.perf_counter()
+            if self.speed and self.steps > (now - self.start)*self.speed:
+                time.sleep(self.steps / self.speed - (now - self.start))
+                now = time.perf_counter()
+            if now - self.sent >= BATCH_TIME:
+                self.flush(now)
+
+    def flush(self, now=None):
+        """Sends the cells that changed since the last batch"""
+        if self.changed:
+            pairs = array('H')
+            for i, value in self.changed.items():
+                pairs.append(i)
+                pairs.append(value)
+            self.events.put(('steps', self.number, pairs.tobytes(), self.steps))
+            self.changed.clear()
+        self.sent = time.perf_counter() if now is None else now
+
+
+class StepSolver(sudoku_solver.Solver):
+    """Solver engine that reports every value it places or takes back,
+    until it found a solution"""
+
+    def __init__(self, grid, emit):
+        super().__init__(grid)
+        self.emit = emit
+
+    def place(self, i, value):
+        super().place(i, value)
+        self.emit(i, value)
+
+    def undo(self, mark):
+        if self.solution is None:
+            for i in self.trail[mark:]:
+                if i >= 0:                  # not a removed candidate
+                    self.emit(i, 0)
+        super().undo(mark)
+
+
+class StepDancingLinks(dlx_solver.DancingLinks):
+    """Dancing links solver that reports the value of every matrix row it
+    picks or drops, while emit is set"""
+
+    def __init__(self, box, emit):
+        super().__init__(box)
+        self.emit = emit
+
+    def select(self, node):
+        super().select(node)
+        if self.emit is not None:
+            row = self.row_of[node]
+            self.emit(row // self.size, row % self.size + 1)
+
+    def deselect(self, node):
+        if self.emit is not None:
+            self.emit(self.row_of[node] // self.size, 0)
+        super().deselect(node)
+
+
+def engine_steps(grid, emit):
+    """Solves a grid with the solver engine, returns True if it has a solution"""
+    return StepSolver(grid, emit).solve()
+
+def dlx_steps(grid, emit):
+    """Solves a grid with the dancing links solver"""
+    solver = StepDancingLinks(sudoku_solver.box_size(grid), emit)
+    found = solver.search(grid)
+    solution = next(found, None)
+
+    # Closing the search unwinds the links, which is not part of the solve
+    solver.emit = None
+    found.close()
+    return solution is not None
+
+def backtrack_steps(grid, emit):
+    """Solves a grid by plain backtracking over the empty cells in reading
+    order, the way the game animates its solve"""
+    solver = sudoku_solver.Solver(grid)
+    if not solver.consistent:
+        return False
+
+    empty = [i for i, value in enumerate(solver.cells) if value == 0]
+    k = 0
+    while k < len(empty):
+        if k < 0:
+            return False
+
+        # Take back the value of the cell and try the next one that fits
+        i = empty[k]
+        last = solver.cells[i]
+        if last:
+            solver.undo(len(solver.trail) - 1)
+            emit(i, 0)
+        cand = solver.candidates(i) >> (last + 1) << (last + 1)
+        if cand:
+            value = (cand & -cand).bit_length() - 1
+            solver.place(i, value)
+            emit(i, value)
+            k += 1
+        else:
+            k -= 1
+    return True
+
+STEP_SOLVERS = {'engine': engine_steps, 'dlx': dlx_steps, 'backtrack': backtrack_steps}
+
+
+def solve_worker(jobs, events, speed=SPEED):
+    """Runs in a worker process: solves the boards of jobs, a list of
+    (board number, cells, backend) tuples, each in a thread of its own"""
+    # Forked workers inherit the signal handler of SDL, which would turn
+    # terminate into a quit event nobody reads
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if hasattr(os, 'nice'):
+        os.nice(WORKER_NICE)
+    threads = [threading.Thread(target=solve_board, args=(*job, events, speed), daemon=True)
+               for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def solve_board(number, cells, backend, events, speed=SPEED):
+    """Solves the puzzle of board number with a backend of STEP_SOLVERS,
+    streaming its steps, and ends with a ('done', board number, solved,
+    steps, seconds) event"""
+    stream = StepStream(number, cells, events, speed)
+    solved = STEP_SOLVERS[backend](sudoku_generator.to_grid(cells), stream)
+    stream.flush()
+    events.put(('done', number, solved, stream.steps, time.perf_counter() - stream.start))
+
+
+# Rank names of the first boards to finish
+RANKS = {1: '1st', 2: '2nd', 3: '3rd'}
+
+class BoardView:
+    """One board of the spectator window, drawn into its own subsurface of
+    the window, with the label below it. The values of the cells are set
+    directly, as the spectator never asks the board for its candidates"""
+
+    def __init__(self, window, rect, grid, backend):
+        size = len(grid)
+        self.surface = window.subsurface(rect)
+        self.offset = rect.topleft
+        self.board = sudoku_gui.Board(self.surface, grid, size, size, rect.width - 1, rect.height - 1)
+        self.background = None              # white board with its gridlines, shared by boards of a size
+        self.label_rect = pygame.Rect(rect.left, rect.bottom, rect.width, LABEL_HEIGHT)
+        self.backend = backend
+        self.steps = 0
+        self.result = None                  # label text once the solver is done
+        self.labelled = 0                   # time the label was last drawn
+
+    def apply(self, pairs, steps):
+        """Fills in the cells of a batch of steps"""
+        board = self.board
+        changes = array('H')
+        changes.frombytes(pairs)
+        for k in range(0, len(changes), 2):
+            i, value = changes[k], changes[k + 1]
+            board.cells[i] = value
+            board.tile(i).dirty = True
+        self.steps = steps
+
+    def finish(self, solved, steps, seconds, rank):
+        """Shows the result of the solver"""
+        self.steps = steps
+        place = RANKS.get(rank, f"{rank}th") if solved else "no solution"
+        self.result = f"{place}  {self.backend}  {steps} steps  {seconds:.2f} s"
+
+    def draw(self):
+        """Draws the tiles that changed and returns the window areas to update"""
+        x, y = self.offset
+        return [rect.move(x, y) for rect in self.board.draw(self.background)]
+
+    def draw_label(self, window, font, now):
+        """Draws the label with the backend and its steps or result"""
+        text = self.result or f"{self.backend}  {self.steps} steps"
+        window.fill(sudoku_gui.WHITE, self.label_rect)
+        window.blit(font.render(text, True, sudoku_gui.BLACK), self.label_rect.move(2, 2))
+        self.labelled = now
+        return self.label_rect
+
+
+def grid_layout(count, size):
+    """Returns the rects of count boards of size x size cells, as large as
+    they fit in a grid of about as many rows as columns in the window"""
+    width, height = WINDOW
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    cell_width, cell_height = width // cols, height // rows
+    side = min(cell_width, cell_height - LABEL_HEIGHT) - 2*MARGIN
+    side -= side % size                     # whole pixels per tile
+    return [pygame.Rect((n % cols)*cell_width + MARGIN, (n // cols)*cell_height + MARGIN, side + 1, side + 1)
+            for n in range(count)]
+
+
+def board_background(board):
+    """Returns a white surface with the gridlines of a board"""
+    background = pygame.Surface((board.boardWidth + 1, board.boardHeight + 1)).convert()
+    background.fill(sudoku_gui.WHITE)
+    board.draw_grid(background)
+    return background
+
+
+def spectate(puzzles, backends, speed=SPEED, duration=None):
+    """Opens the spectator window with a board per puzzle, board n solved by
+    backends[n % len(backends)], and shows the solvers until the window is
+    closed, ESC is pressed or duration seconds have passed"""
+    global pygame
+    sudoku_gui.init_pygame()
+    pygame = sudoku_gui.pygame
+
+    window = pygame.display.set_mode(WINDOW)
+    pygame.display.set_caption(f"Sudokupy - spectator, {len(puzzles)} boards")
+    window.fill(sudoku_gui.WHITE)
+    font = sudoku_gui.assets.load_font('lato', LABEL_HEIGHT - 6)
+
+    size = len(puzzles[0])
+    backgrounds = {}
+    views = []
+    for n, (grid, rect) in enumerate(zip(puzzles, grid_layout(len(puzzles), size))):
+        view = BoardView(window, rect, grid, backends[n % len(backends)])
+        if rect.size not in backgrounds:
+            backgrounds[rect.size] = board_background(view.board)
+        view.background = backgrounds[rect.size]
+        view.surface.blit(view.background, (0, 0))
+        view.draw()
+        view.draw_label(window, font, 0)
+        views.append(view)
+    pygame.display.flip()
+
+    # The boards are dealt out over the workers, so boards that race each
+    # other end up in different workers
+    events = multiprocessing.Queue()
+    jobs = [(n, [value for row in grid for value in row], view.backend)
+            for n, (grid, view) in enumerate(zip(puzzles, views))]
+    count = min(WORKERS, len(jobs))
+    workers = [multiprocessing.Process(target=solve_worker, daemon=True,
+                                       args=(jobs[k::count], events, speed))
+               for k in range(count)]
+    for worker in workers:
+        worker.start()
+
+    clock = pygame.time.Clock()
+    started = time.perf_counter()
+    frames = 0
+    frame_times = []                        # seconds of work per frame, without the wait for the next one
+
+    # Boards on the same puzzle are ranked against each other, a single backend ranks all boards
+    racers = len(backends) if len(backends) > 1 else len(views)
+    finished = [0]*math.ceil(len(views) / racers)   # solved boards per race
+
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                running = False
+        start = time.perf_counter()
+        if duration is not None and start - started > duration:
+            running = False
+
+        # Take everything the workers sent since the last frame
+        changed = set()
+        while True:
+            try:
+                message = events.get_nowait()
+            except queue.Empty:
+                break
+            kind, n, *data = message
+            view = views[n]
+            if kind == 'steps':
+                view.apply(*data)
+            else:
+                finished[n // racers] += data[0]
+                view.finish(*data, finished[n // racers])
+                view.labelled = 0
+            changed.add(view)
+
+        # Only the boards that changed are drawn, their labels a few times a second
+        rects = []
+        for view in changed:
+            rects += view.draw()
+            if start - view.labelled >= LABEL_INTERVAL:
+                rects.append(view.draw_label(window, font, start))
+
+        if rects:
+            pygame.display.update(rects)
+        frames += 1
+        frame_times.append(time.perf_counter() - start)
+        clock.tick(FPS)
+
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+        worker.join()
+
+    seconds = time.perf_counter() - started
+    frame_times.sort()
+    print(f"Drew {frames} frames of {len(views)} boards in {seconds:.1f} s ({frames / seconds:.1f} fps), "
+          f"frame work p50 {frame_times[len(frame_times) // 2]*1000:.2f} ms, p99 {frame_times[len(frame_times)*99 // 100]*1000:.2f} ms, "
+          f"max {frame_times[-1]*1000:.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch solvers race on many boards at once")
+    parser.add_argument('--boards', type=int, default=16, help="number of boards (default: 16)")
+    parser.add_argument('--backend', action='append', choices=sorted(STEP_SOLVERS),
+                        help="solver of the boards, repeat to race several (default: engine)")
+    parser.add_argument('--speed', type=int, default=SPEED,
+                        help=f"steps per second of every solver, 0 for as fast as possible (default: {SPEED})")
+    parser.add_argument('--library', help="puzzle library to take the puzzles from")
+    parser.add_argument('--puzzle', type=int, default=1, help="number of the first library puzzle (default: 1)")
+    parser.add_argument('--size', type=int, choices=[4, 9, 16], default=9,
+                        help="size of generated puzzles (default: 9)")
+    parser.add_argument('--difficulty', choices=sudoku_generator.DIFFICULTIES, default='hard',
+                        help="difficulty of generated puzzles (default: hard)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first generated puzzle (default: 0)")
+    parser.add_argument('--duration', type=float, help="close the window after this many seconds")
+    args = parser.parse_args(argv)
+
+    backends = args.backend or ['engine']
+    if args.boards < 1:
+        parser.error("--boards must be at least 1")
+    if args.speed < 0:
+        parser.error("--speed must not be negative")
+
+    # Boards that race each other get the same puzzle
+    count = math.ceil(args.boards / len(backends))
+    if args.library:
+        with PuzzleLibrary(args.library) as library:
+            if not 1 <= args.puzzle <= len(library):
+                parser.error(f"--puzzle must be between 1 and {len(library)}")
+            try:
+                grids = [library[(args.puzzle - 1 + n) % len(library)] for n in range(count)]
+            except ValueError as error:
+                parser.error(str(error))
+    else:
+        box = int(round(args.size ** 0.5))
+        grids = [sudoku_generator.generate(args.seed + n, args.difficulty, box) for n in range(count)]
+
+    puzzles = [grids[n // len(backends)] for n in range(args.boards)]
+    spectate(puzzles, backends, args.speed, args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+## Headless batch tools for puzzle files, usable without pygame or a display
+#
+#   python -m sudoku_batch solve puzzles.txt -o solutions.txt
+#   python -m sudoku_batch generate 1000 --difficulty hard --seed 1 -o puzzles.txt
+#   python -m sudoku_batch pack puzzles.txt -o puzzles.sdkp
+#
+# Puzzle files hold one puzzle per line in the common 81 character format, with
+# the digits 1-9 for givens and 0 or . for empty cells. Anything after the first
+# 81 characters of a line is ignored, as are blank lines and lines starting with #.
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import sudoku_solver
+import sudoku_generator
+import dlx_solver
+import puzzle_library
+
+
+def parse_puzzle(line):
+    """Turns an 81 character puzzle line into a 9x9 list of lists,
+    returns None if the line is not a valid puzzle"""
+    text = line.strip()[:81]
+    if len(text) != 81:
+        return None
+
+    cells = []
+    for char in text:
+        if char in '.0':
+            cells.append(0)
+        elif '1' <= char <= '9':
+            cells.append(int(char))
+        else:
+            return None
+    return [cells[r*9 : r*9 + 9] for r in range(9)]
+
+
+def format_grid(grid):
+    """Turns a 9x9 grid into an 81 character line"""
+    return ''.join(str(value) for row in grid for value in row)
+
+
+def read_puzzles(file):
+    """Yields (line number, puzzle line) for every puzzle line in a file"""
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield number, line
+
+
+def solve_line(line, max_nodes=None, backend='engine'):
+    """Solves a single puzzle line with the bitmask engine or the dancing
+    links solver. Returns the solution line (empty if there is none), the
+    number of solutions found (up to 2) and the time it took in seconds.
+    Invalid lines give a solution count of -1 and puzzles that need more
+    than max_nodes search nodes a count of None"""
+    start = time.perf_counter()
+    grid = parse_puzzle(line)
+    if grid is None:
+        return '', -1, time.perf_counter() - start
+
+    if backend == 'dlx':
+        found = []
+        solutions = dlx_solver.iter_solutions(grid, max_nodes)
+        try:
+            for solution in solutions:
+                found.append(solution)
+                if len(found) == 2:
+                    break
+            count = len(found)
+        except sudoku_solver.SearchLimitExceeded:
+            count = None
+        finally:
+            solutions.close()
+        solution = format_grid(found[0]) if found else ''
+        return solution, count, time.perf_counter() - start
+
+    solver = sudoku_solver.Solver(grid, max_nodes)
+    try:
+        count = solver.count(limit=2)
+    except sudoku_solver.SearchLimitExceeded:
+        count = None
+    solution = format_grid(solver.grid()) if solver.solution else ''
+    return solution, count, time.perf_counter() - start
+
+
+def solve_chunk(lines, max_nodes=None, backend='engine'):
+    """Solves a list of puzzle lines, runs inside the worker processes"""
+    return [solve_line(line, max_nodes, backend) for line in lines]
+
+
+def chunked(items, size):
+    """Groups an iterable into lists of at most size items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def solve_stream(puzzles, jobs, chunk_size, max_nodes=None, backend='engine'):
+    """Solves (line number, puzzle line) pairs in chunks across worker
+    processes and yields (line number, result) in input order. Only a
+    bounded number of chunks is in flight, so the input is streamed"""
+    chunks = chunked(puzzles, chunk_size)
+
+    # A single job runs in this process, which is easier to profile
+    if jobs == 1:
+        for chunk in chunks:
+            yield from zip([n for n, _ in chunk], solve_chunk([line for _, line in chunk], max_nodes, backend))
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for chunk in chunks:
+            numbers = [n for n, _ in chunk]
+            pending.append((numbers, executor.submit(solve_chunk, [line for _, line in chunk], max_nodes, backend)))
+
+            # Keep a few chunks per worker queued, then write out the oldest
+            if len(pending) >= jobs*4:
+                numbers, future = pending.popleft()
+                yield from zip(numbers, future.result())
+
+        while pending:
+            numbers, future = pending.popleft()
+            yield from zip(numbers, future.result())
+
+
+def percentile(sorted_values, fraction):
+    """Returns the value at the given fraction of a sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def solve_command(args):
+    """Solves all puzzles of a file and writes the solutions in input order"""
+    source = sys.stdin if args.puzzles == '-' else open(args.puzzles)
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+
+    latencies = []
+    unsolvable = []
+    ambiguous = []
+    invalid = []
+    gave_up = []
+
+    start = time.perf_counter()
+    try:
+        for number, (solution, count, seconds) in solve_stream(read_puzzles(source), args.jobs, args.chunk_size,
+                                                                     args.max_nodes, args.backend):
+            output.write(solution + '\n')
+            latencies.append(seconds)
+            if count is None:
+                gave_up.append(number)
+            elif count == -1:
+                invalid.append(number)
+            elif count == 0:
+                unsolvable.append(number)
+            elif count > 1:
+                ambiguous.append(number)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    total = time.perf_counter() - start
+
+    latencies.sort()
+    report = sys.stderr
+    print(f"Solved {len(latencies)} puzzles in {total:.2f} s "
+          f"({len(latencies) / total if total else 0:.0f} puzzles/s)", file=report)
+    print(f"Latency per puzzle: p50 {percentile(latencies, 0.50)*1000:.2f} ms, "
+          f"p99 {percentile(latencies, 0.99)*1000:.2f} ms", file=report)
+    for name, numbers in (("Invalid", invalid), ("Unsolvable", unsolvable), ("Ambiguous", ambiguous),
+                          ("Unfinished", gave_up)):
+        if numbers:
+            shown = ', '.join(str(n) for n in numbers[:20])
+            more = f" and {len(numbers) - 20} more" if len(numbers) > 20 else ""
+            print(f"{name} puzzles on lines: {shown}{more}", file=report)
+
+    return 1 if invalid or unsolvable or ambiguous or gave_up else 0
+
+
+def generate_one(seed, difficulty):
+    """Generates a single puzzle line, runs inside the worker processes"""
+    return format_grid(sudoku_generator.generate(seed, difficulty))
+
+
+def generate_command(args):
+    """Generates puzzles and writes them one per line. With a seed, puzzle n
+    uses seed + n, so the output is the same for any number of jobs"""
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+    seeds = [None if args.seed is None else args.seed + n for n in range(args.count)]
+    difficulties = [args.difficulty]*args.count
+
+    start = time.perf_counter()
+    try:
+        if args.jobs == 1:
+            puzzles = map(generate_one, seeds, difficulties)
+            for puzzle in puzzles:
+                output.write(puzzle + '\n')
+        else:
+            with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+                chunksize = max(1, min(100, args.count // (args.jobs*4)))
+                for puzzle in executor.map(generate_one, seeds, difficulties, chunksize=chunksize):
+                    output.write(puzzle + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    total = time.perf_counter() - start
+
+    print(f"Generated {args.count} {args.difficulty} puzzles in {total:.2f} s "
+          f"({args.count / total * 60 if total else 0:.0f} puzzles/min)", file=sys.stderr)
+    return 0
+
+
+def pack_command(args):
+    """Packs a puzzle file into a library with 4 bits per cell, which the
+    game can open with --library"""
+    source = sys.stdin if args.puzzles == '-' else open(args.puzzles)
+    invalid = []
+
+    def grids():
+        for number, line in read_puzzles(source):
+            grid = parse_puzzle(line)
+            if grid is None:
+                invalid.append(number)
+            else:
+                yield grid
+
+    try:
+        count = puzzle_library.pack_puzzles(grids(), args.output)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    print(f"Packed {count} puzzles into {args.output} ({os.path.getsize(args.output)} bytes)", file=sys.stderr)
+    if invalid:
+        shown = ', '.join(str(n) for n in invalid[:20])
+        more = f" and {len(invalid) - 20} more" if len(invalid) > 20 else ""
+        print(f"Skipped invalid puzzles on lines: {shown}{more}", file=sys.stderr)
+    return 1 if invalid else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='sudoku_batch', description="Headless sudoku batch tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    solve = commands.add_parser('solve', help="solve a file of puzzles, one per line")
+    solve.add_argument('puzzles', help="puzzle file, or - for stdin")
+    solve.add_argument('-o', '--output', help="file to write the solutions to (default: stdout)")
+    solve.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                       help="number of worker processes (default: number of cpus)")
+    solve.add_argument('--chunk-size', type=int, default=500,
+                       help="number of puzzles sent to a worker at once (default: 500)")
+    solve.add_argument('--max-nodes', type=int,
+                       help="give up on puzzles that need more search nodes than this")
+    solve.add_argument('--backend', choices=('engine', 'dlx'), default='engine',
+                       help="bitmask engine or dancing links solver (default: engine)")
+    solve.set_defaults(func=solve_command)
+
+    generate = commands.add_parser('generate', help="generate puzzles with a unique solution")
+    generate.add_argument('count', type=int, help="number of puzzles to generate")
+    generate.add_argument('--difficulty', choices=sudoku_generator.DIFFICULTIES, default='medium',
+                          help="difficulty of the puzzles (default: medium)")
+    generate.add_argument('--seed', type=int, help="seed to make the output reproducible")
+    generate.add_argument('-o', '--output', help="file to write the puzzles to (default: stdout)")
+    generate.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                          help="number of worker processes (default: number of cpus)")
+    generate.set_defaults(func=generate_command)
+
+    pack = commands.add_parser('pack', help="pack a file of puzzles into a library with 4 bits per cell")
+    pack.add_argument('puzzles', help="puzzle file, or - for stdin")
+    pack.add_argument('-o', '--output', required=True, help="library file to write")
+    pack.set_defaults(func=pack_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+## Puzzle generator built on the bitmask solver
+#
+# A random complete grid is made by filling the diagonal boxes (which never share
+# a row or column) with shuffled digits and letting the solver complete it.
+# Clues are then removed in random order, keeping a removal only if the puzzle
+# still has a unique solution and is no harder than the requested difficulty.
+
+import random
+
+from sudoku_solver import Solver, layout, iter_digits
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+# Grids tried before settling for an easier puzzle. Small grids such as 4x4
+# have few or no puzzles that need hidden singles or guessing
+MAX_GRIDS = 100
+
+
+def naked_singles_only(grid):
+    """Checks if a grid can be solved by filling in naked singles alone"""
+    solver = Solver(grid)
+    if not solver.consistent:
+        return False
+
+    cells = solver.cells
+    progress = True
+    while progress:
+        progress = False
+        for i in range(len(cells)):
+            if cells[i] == 0:
+                cand = solver.candidates(i)
+                if cand & (cand - 1) == 0:
+                    if cand == 0:
+                        return False
+                    solver.place(i, next(iter_digits(cand)))
+                    progress = True
+    return 0 not in cells
+
+
+def grade(grid):
+    """Grades a puzzle with a unique solution. Returns the difficulty name
+    and the number of search nodes the solver needed.
+    easy:   solvable with naked singles only
+    medium: solvable with naked and hidden singles
+    hard:   needs guessing"""
+    solver = Solver(grid)
+    solver.solve()
+    if naked_singles_only(grid):
+        return 'easy', solver.nodes
+
+    probe = Solver(grid)
+    if probe.propagate() and 0 not in probe.cells:
+        return 'medium', solver.nodes
+    return 'hard', solver.nodes
+
+
+def to_grid(cells):
+    """Turns a flat list of cells into a square grid of lists"""
+    size = int(round(len(cells) ** 0.5))
+    return [cells[r*size : (r+1)*size] for r in range(size)]
+
+
+def random_solution(rng, box=3):
+    """Returns a random complete grid with box x box boxes as a flat list"""
+    tables = layout(box)
+
+    # Some fillings of small grids cannot be completed, those are tried again
+    solved = False
+    while not solved:
+        cells = [0]*tables.ncells
+        for n in range(box):
+            digits = list(range(1, tables.size + 1))
+            rng.shuffle(digits)
+            for i, value in zip(tables.boxes[n*(box + 1)], digits):
+                cells[i] = value
+
+        solver = Solver(to_grid(cells))
+        solved = solver.solve()
+
+    # Relabeling the digits keeps the grid valid and adds more variety
+    relabel = list(range(1, tables.size + 1))
+    rng.shuffle(relabel)
+    return [relabel[value - 1] for value in solver.solution]
+
+
+def has_other_solution(cells, i, value):
+    """Checks if the grid in cells, which has a solution with value in the
+    empty cell i, also has a solution with a different value there"""
+    solver = Solver(to_grid(cells))
+    for other in iter_digits(solver.candidates(i) & ~(1 << value)):
+        mark = len(solver.trail)
+        solver.place(i, other)
+        if solver.search(1):
+            return True
+        solver.undo(mark)
+    return False
+
+
+def within_difficulty(cells, difficulty):
+    """Checks if a puzzle is no harder than the given difficulty"""
+    grid = to_grid(cells)
+    if difficulty == 'easy':
+        return naked_singles_only(grid)
+
+    probe = Solver(grid)
+    return probe.propagate() and 0 not in probe.cells
+
+
+def generate(seed=None, difficulty='medium', box=3):
+    """Generates a puzzle with a unique solution as a list of lists, with
+    box x box boxes (so 9x9 by default). The same seed always gives the
+    same puzzle. Clues are removed for as long as the puzzle stays unique
+    and no harder than the difficulty, and grids that end up easier than
+    the difficulty are thrown away, up to MAX_GRIDS times"""
+    if difficulty not in DIFFICULTIES:
+        raise ValueError(f"Unknown difficulty {difficulty!r}, expected one of {DIFFICULTIES}")
+
+    rng = random.Random(seed)
+    easier = DIFFICULTIES[DIFFICULTIES.index(difficulty) - 1] if difficulty != 'easy' else None
+    for _ in range(MAX_GRIDS):
+        cells = remove_clues(random_solution(rng, box), rng, difficulty)
+        if easier is None or not within_difficulty(cells, easier):
+            break
+    return to_grid(cells)
+
+
+def remove_clues(solution, rng, difficulty):
+    """Removes clues from a complete grid in random order, keeping the
+    puzzle unique and within the difficulty. Returns the flat puzzle"""
+    cells = solution[:]
+
+    order = list(range(len(cells)))
+    rng.shuffle(order)
+    for i in order:
+        value = cells[i]
+        cells[i] = 0
+
+        # Puzzles that singles can solve are always unique, so only hard
+        # puzzles need the more expensive check for a second solution
+        if difficulty == 'hard':
+            keep = has_other_solution(cells, i, value)
+        else:
+            keep = not within_difficulty(cells, difficulty)
+
+        if keep:
+            cells[i] = value
+
+    return cells
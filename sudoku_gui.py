@@ -1,9 +1,25 @@
-import pygame
 import time
-from dokusan import generators
-import numpy as np
 
-pygame.init()
+# Start of the program, for the time it takes to show the first frame
+STARTED = time.perf_counter()
+
+import argparse
+import collections
+import functools
+import os
+import random
+import sudoku_solver
+import sudoku_hints
+import sudoku_generator
+import dlx_solver
+import savegame
+from assets import Assets, GlyphCache, ASSET_DIR
+from puzzle_pool import PuzzlePool
+from puzzle_library import PuzzleLibrary
+
+# pygame is only imported and started by init_pygame, so the solver functions
+# of this module can be used without it
+pygame = None
 
 WHITE   = (255,255,255)
 BLACK   = (0,0,0)
@@ -11,123 +27,521 @@ RED     = (204, 0, 0)
 GREEN   = (0, 153, 0)
 GRAY    = (96,96,96)
 BLUE    = (0,64,255)
+ORANGE  = (230,130,0)
+PURPLE  = (128,0,160)
+
+# Kinds of tile borders, from the one drawn first when a tile has several
+BORDERS = ('conflict', 'hint', 'solver')
+
+FPS     = 60                            # frame rate cap of the main loop
+IDLE_POLL   = 1000 // FPS               # ms between checks for input while idle
+HIDDEN_POLL = 250                       # the same while the window cannot be seen
+
+# Difficulty of newly generated sudokus and where unused ones are kept
+DIFFICULTY = 'medium'
+POOL_FILE  = os.path.join(ASSET_DIR, 'puzzle_pool.txt')
+
+# Unfinished game that is saved on quit and carried on with at the next start
+SAVE_FILE  = os.path.join(ASSET_DIR, 'savegame.sav')
+
+# Solvers that Board.solve can use, both take a grid and return its solution or None
+BACKENDS = {'engine': sudoku_solver.solve, 'dlx': dlx_solver.solve}
+
+# Search nodes allowed when checking that a loaded puzzle has one solution
+MAX_CHECK_NODES = 20000
+
+# Steps per frame of the animated solve, None runs as fast as possible
+SOLVE_SPEEDS = [1, 2, 5, 10, 50, 200, 1000, None]
+
+# Values above 9 are typed as two digits within TWO_DIGIT_TIME seconds
+TWO_DIGIT_TIME = 1.0
+CLOCK_EVENT = None                      # event type of the once a second clock timer, set by init_pygame
+
+# Commands that keys can be bound to, with the Game method that carries each out
+COMMANDS = {
+    'up': 'move', 'down': 'move', 'left': 'move', 'right': 'move',
+    **{str(d): 'digit' for d in range(10)},
+    'guess': 'guess', 'clear': 'clear_marks', 'erase': 'erase_mark', 'fill': 'fill_marks',
+    'hint': 'hint', 'solve': 'solve', 'stats': 'toggle_stats', 'restart': 'restart',
+    'new': 'new_game', 'next': 'next_puzzle', 'previous': 'previous_puzzle', 'quit': 'quit',
+    'undo': 'undo', 'redo': 'redo', 'click': 'click',
+}
+
+# While the animated solve runs, the keys control the solver and only a few others still work
+SOLVING_COMMANDS = {
+    'solve': 'pause', 'faster': 'faster', 'slower': 'slower', 'quit': 'abort',
+    'stats': 'toggle_stats', 'restart': 'restart', 'new': 'new_game',
+    'next': 'next_puzzle', 'previous': 'previous_puzzle', 'click': 'click',
+}
+
+# Edits that can be undone, older ones are forgotten
+HISTORY_LIMIT = 10000
+
+# Repeats of these commands in one frame, such as a held arrow key, become one command
+MOVES = ('up', 'down', 'left', 'right')
+
+# Keys of every command by pygame key name, ctrl+ in front of a name means with ctrl held
+DEFAULT_BINDINGS = {
+    'up': ['up'], 'down': ['down'], 'left': ['left'], 'right': ['right'],
+    **{str(d): [str(d), f'[{d}]'] for d in range(10)},
+    'guess': ['return', 'enter'], 'clear': ['delete'], 'erase': ['backspace'], 'fill': ['a'],
+    'hint': ['h'], 'solve': ['space'], 'stats': ['i'], 'restart': ['r'], 'new': ['g'],
+    'next': ['page down'], 'previous': ['page up'], 'quit': ['escape'],
+    'faster': ['+', '=', '[+]'], 'slower': ['-', '[-]'], 'undo': ['ctrl+z'], 'redo': ['ctrl+y'],
+}
+KEYS_FILE = os.path.join(ASSET_DIR, 'keybindings.txt')
+
+# Rows of the instruction panel, the commands of every row and what they do
+PANEL_ROWS = [
+    (('up', 'down', 'left', 'right'), "select"),
+    (tuple(str(d) for d in range(10)), "sketch"),
+    (('guess',), "guess"), (('clear',), "clear"), (('erase',), "erase"),
+    (('fill',), "auto-fill"), (('hint',), "hint"), (('solve',), "solve"),
+    (('faster', 'slower'), "speed"), (('stats',), "stats"), (('undo',), "undo"),
+    (('redo',), "redo"), (('restart',), "restart"), (('new',), "new"),
+    (('previous', 'next'), "puzzle"), (('quit',), "quit"),
+]
+
+# Short names of keys in the instruction panel, others are shown in capitals
+KEY_LABELS = {
+    'up': 'UP', 'down': 'DN', 'left': 'LT', 'right': 'RT', 'return': 'ENTER',
+    'backspace': 'BKSP', 'delete': 'DEL', 'escape': 'ESC', 'page up': 'PGUP', 'page down': 'PGDN',
+}
+
+# Held keys repeat after REPEAT_DELAY ms, every REPEAT_INTERVAL ms
+REPEAT_DELAY = 300
+REPEAT_INTERVAL = 40
+
+# Fixed areas of the side panel and end screen, as (x, y, width, height)
+TIMEBOX = (720, 0, 270, 162)
+ERRBOX  = (720, 160, 270, 81)
+ENDBOX  = (990/4, 270, 500, 150)
+CATBOX  = (720, 560, 270, 162)
+
+def init_pygame():
+    """Imports pygame and starts only the display and font subsystems, then
+    loads the fonts of the side panel. Later calls do nothing"""
+    global pygame, errfont, timefont, commfont, panelfont, endfont, CLOCK_EVENT
+    if pygame is not None:
+        return
+
+    import pygame as module
+    module.display.init()
+    module.font.init()
+    pygame = module
+    CLOCK_EVENT = pygame.event.custom_type()
+
+    errfont = assets.load_font('lato', 40)
+    timefont = assets.load_font('lato', 70)
+    commfont = assets.load_font('lato', 30)
+    panelfont = assets.load_font('lato', 15)
+    endfont = assets.load_font('lato', 100)
 
 class Tile:
-    """Object that represents a single tile in the Sudoku grid"""
+    """Object that represents a single tile in the Sudoku grid. Tiles only
+    hold what is specific to them: the value lives in the board and the
+    rect is shared by all boards of the same size"""
+
+    __slots__ = ('board', 'index', 'row', 'col', 'marks', 'selected', 'dirty', 'borders', 'tile_rect')
 
-    def __init__(self, value, row, col, gap):
-        self.value = value
+    def __init__(self, board, row, col, tile_rect):
+        self.board = board                  # board that owns the cell values
+        self.index = row*board.ncols + col  # position of the tile in board.cells
         self.row = row
         self.col = col
-        self.gap = gap
-        self.temp_values = []
+        self.marks = 0                      # temporary values, bit 1 << value per value
         self.selected = False
-        self.x = self.row*self.gap
-        self.y = self.col*self.gap
-        self.tile_rect = pygame.Rect(self.x+1, self.y+1, self.gap, self.gap)
+        self.dirty = True                   # tile needs to be redrawn
+        self.borders = {}                   # border color of every kind of BORDERS the tile has
+        self.tile_rect = tile_rect
+
+    @property
+    def value(self):
+        """Value of the tile, read from the cells of the board"""
+        return self.board.cells[self.index]
 
     def add_temp(self, value):
         """Adds a temporary value to the tile"""
-        if value not in self.temp_values and len(self.temp_values) < 4:
-            self.temp_values = self.temp_values + [value]
-        else:
-            if value not in self.temp_values:
-                self.temp_values[-1] = value
+        self.marks |= 1 << value
+        self.dirty = True
 
-    def remove_temp(self):
-        """Removes the last value in the temporary value list"""
-        self.temp_values.pop(-1)
+    def remove_temp(self, value=None):
+        """Removes a temporary value, or the highest one if no value is given"""
+        if value is None:
+            value = self.marks.bit_length() - 1
+        if value > 0:
+            self.marks &= ~(1 << value)
+            self.dirty = True
 
     def clear_temp(self):
         """Clears the tile of temporary values"""
-        self.temp_values = []
-
-    def set_val(self, value):
-        """Sets the value of the tile"""
-        self.value = value
-
-    def draw(self, window, select_color=BLUE):
-        """Draws the tile and the corresponding value within it"""
-
-        # Draws temporary values
-        if self.value == 0 and len(self.temp_values) != 0:
+        self.marks = 0
+        self.dirty = True
+
+    def set_highlight(self, kind, color):
+        """Sets the border color of one kind of BORDERS, None removes it"""
+        if self.borders.get(kind) != color:
+            if color is None:
+                del self.borders[kind]
+            else:
+                self.borders[kind] = color
+            self.dirty = True
+
+    def border(self):
+        """Returns the color of the border drawn around the tile, or None"""
+        for kind in BORDERS:
+            if kind in self.borders:
+                return self.borders[kind]
+        return None
+
+    def set_selected(self, selected):
+        """Sets the selected status of the tile"""
+        if self.selected != selected:
+            self.selected = selected
+            self.dirty = True
+
+    def draw(self, window, background, select_color=BLUE):
+        """Draws the tile and the corresponding value within it on top of
+        the matching part of the background"""
+
+        window.blit(background, self.tile_rect, self.tile_rect)
+
+        # Draws temporary values, every value at its own spot of a box sized grid.
+        # Values that are no longer candidates of the tile are drawn in red
+        if self.value == 0 and self.marks:
             xpos, ypos = self.tile_rect.topleft
+            box = self.board.box
+            part = self.tile_rect.width / box
+            candidates = self.board.candidates.masks[self.index]
 
-            X = 0
-            for tempval in self.temp_values:
-                metric = tinyfont.metrics(str(tempval))
-                text = tinyfont.render(str(tempval), True, GRAY)
+            for tempval in sudoku_solver.iter_digits(self.marks):
+                color = GRAY if candidates & (1 << tempval) else RED
 
                 # Only highlight the value that is currently selected
-                if tempval != key or not self.selected:
-                    text.set_alpha(127)
- 
-                text_rect = text.get_rect(center = (xpos + X + 13, ypos + 18))
-                window.blit(text, text_rect) 
+                if tempval != self.board.key or not self.selected:
+                    text = glyphs.render(self.board.mark_font, str(tempval), color, 127)
+                else:
+                    text = glyphs.render(self.board.mark_font, str(tempval), color)
 
-                X += metric[0][-1]
+                spot = tempval - 1
+                center = (xpos + (spot % box + 0.5)*part, ypos + (spot // box + 0.5)*part)
+                window.blit(text, text.get_rect(center = center))
 
         # Draw the set value
         elif self.value != 0:
-            text = font.render(str(self.value), True, BLACK)
+            text = glyphs.render(self.board.value_font, str(self.value), BLACK)
             text_rect = text.get_rect(center = self.tile_rect.center)
             window.blit(text, text_rect)
 
+        # Draw the border of a conflict, a hint or the animated solver
+        border = self.border()
+        if border is not None:
+            pygame.draw.rect(window, border, self.tile_rect, 3)
+
         # Draw the indicator if selected
         if self.selected:
             pygame.draw.rect(window, select_color, self.tile_rect, 3)
 
-    def draw_solvestep(self, window, color=GREEN):
-        """Draw function for the GUI solver"""
+        self.dirty = False
 
-        pygame.draw.rect(window, WHITE, (self.x+1, self.y+1, self.gap, self.gap), 0)
 
-        text = font.render(str(self.value), True, BLACK)
-        text_rect = text.get_rect(center = self.tile_rect.center)
-        window.blit(text, text_rect)
-        pygame.draw.rect(window, color, (self.x+1, self.y+1, self.gap, self.gap), 3)
+# Tile rects of every board size, shared by all boards of that size
+tile_rect_cache = {}
+
+def tile_rects(nrows, ncols, gap):
+    """Returns the rects of all tiles of a board, row by row"""
+    size = (nrows, ncols, gap)
+    if size not in tile_rect_cache:
+        tile_rect_cache[size] = [pygame.Rect(n*gap + 1, m*gap + 1, gap, gap)
+                                 for m in range(nrows) for n in range(ncols)]
+    return tile_rect_cache[size]
+
+
+class History:
+    """Undo and redo stacks of the edits to a board. An edit is kept as a
+    tuple of deltas, one per cell it changed, of the form (cell, old value,
+    new value, old marks, new marks, old removed, new removed) where removed
+    are the candidates taken out by hints. Deltas replace copies of the
+    board, and only the last limit edits are kept, so memory stays flat
+    however long a game goes on"""
+
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.undos = collections.deque(maxlen=limit)
+        self.redos = []
+
+    def record(self, deltas):
+        """Adds an edit, which makes the undone edits unreachable. Edits
+        that change nothing are left out"""
+        if deltas:
+            self.undos.append(tuple(deltas))
+            self.redos.clear()
+
+    def undo(self):
+        """Returns the last edit and moves it to the redo stack, None if there is none"""
+        if not self.undos:
+            return None
+        deltas = self.undos.pop()
+        self.redos.append(deltas)
+        return deltas
+
+    def redo(self):
+        """Returns the last undone edit and moves it back, None if there is none"""
+        if not self.redos:
+            return None
+        deltas = self.redos.pop()
+        self.undos.append(deltas)
+        return deltas
 
 
 class Board:
-    """Object representing the Sudoku board"""
-    
+    """Object representing the Sudoku board. The values of all cells live
+    in a flat bytearray of the live candidates, which count every digit per
+    row, column and box, so checking if a value fits or the board is full
+    never has to look at more than one cell and setting a value only updates
+    the candidates of its peers.
+    Boards can have any n^2 x n^2 size, such as 4x4, 9x9, 16x16 or 25x25"""
+
     def __init__(self, window, board, nrows, ncols, boardWidth, boardHeight):
+        init_pygame()
         self.nrows = nrows                  # number of rows on board
         self.ncols = ncols                  # number of cols on board
         self.win = window
         self.board = board
-        self.model = None                   # model that stores the tile values
+        self.box = sudoku_solver.box_size(board) # number of rows and cols of a box
+        self.candidates = sudoku_hints.Candidates(self.box)  # digit counts and candidates of every cell
+        self.cells = self.candidates.cells  # tile values, row by row
+        self.empty = nrows*ncols            # number of empty cells
+        self.solution = None                # cached solution of the puzzle
+        self.stats = None                   # solver statistics of the cached solution
+        self.gui_stats = None               # statistics of the animated solve
         self.boardWidth = boardWidth        # board width in pixels
         self.boardHeight = boardHeight      # board height in pixels
-        self.gap = self.boardWidth / 9      # distance between gridlines
+        self.gap = self.boardWidth / ncols  # distance between gridlines
         self.selected = None                # currently selected row and col
         self.select_color = BLUE
+        self.key = None                     # value being typed, its sketch is highlighted in the selected tile
+        self.hint = None                    # hint currently shown on the board
+        self.conflicts = []                 # tiles outlined as conflicts of the typed value
+        self.history = History()            # edits of the player that can be undone
+
+        # Fonts scale with the tiles, 50 and 30 on a 9x9 board
+        self.value_font = assets.load_font('lato', int(self.gap*5/8))
+        self.mark_font = assets.load_font('lato', int(self.gap*9/8 / max(self.box, 3)))
 
         # Creating an array of tiles
-        self.tiles = [[Tile(self.board[m][n], m, n, self.gap) for m in range(self.nrows)] for n in range(self.ncols)]
-        
-        self.update_model()
+        rects = tile_rects(self.nrows, self.ncols, self.gap)
+        self.tiles = [[Tile(self, m, n, rects[m*self.ncols + n]) for n in range(self.ncols)]
+                      for m in range(self.nrows)]
 
-    def update_model(self):
-        """Updating a model grid with values from the tiles"""
-        self.model = [[self.tiles[m][n].value for n in range(self.ncols)] for m in range(self.nrows)]
+        for m in range(self.nrows):
+            for n in range(self.ncols):
+                self.set_value(m, n, self.board[m][n])
+
+    @property
+    def model(self):
+        """The tile values as a grid of lists, built on demand for the solvers"""
+        return [list(self.cells[m*self.ncols : (m+1)*self.ncols]) for m in range(self.nrows)]
+
+    def tile(self, i):
+        """Returns the tile of cell i of the flat cells"""
+        return self.tiles[i // self.ncols][i % self.ncols]
+
+    def set_value(self, row, col, value):
+        """Sets the value of a tile and updates the candidates and the
+        number of empty cells"""
+        i = row*self.ncols + col
+        old = self.candidates.set(i, value)
+        if old == value:
+            return
+
+        if old == 0:
+            self.empty -= 1
+        if value == 0:
+            self.empty += 1
+        self.tiles[row][col].dirty = True
+
+        # Sketched values of the peers may have stopped or started to conflict
+        changed = (1 << old | 1 << value) & ~1
+        ncols = self.ncols
+        for p in self.candidates.peers[i]:
+            tile = self.tiles[p // ncols][p % ncols]
+            if tile.marks & changed:
+                tile.dirty = True
+
+    def edit(self, row, col, value, marks):
+        """Sets the value and the temporary values of a tile as one edit
+        that can be undone"""
+        i = row*self.ncols + col
+        removed = self.candidates.removed[i] if value == self.cells[i] else 0
+        self.change([(i, value, marks, removed)])
+
+    def change(self, changes):
+        """Makes changes (cell, value, marks, removed candidates) to several
+        cells as one edit that can be undone"""
+        deltas = []
+        for i, value, marks, removed in changes:
+            tile = self.tile(i)
+            old_removed = self.candidates.removed[i]
+            if (tile.value, tile.marks, old_removed) != (value, marks, removed):
+                deltas.append((i, tile.value, value, tile.marks, marks, old_removed, removed))
+            self.put(i, value, marks, removed)
+        self.history.record(deltas)
+
+    def put(self, i, value, marks, removed):
+        """Sets the value, the temporary values and the candidates removed
+        by hints of cell i"""
+        tile = self.tile(i)
+        self.set_value(tile.row, tile.col, value)
+        if self.candidates.removed[i] != removed:
+            self.candidates.set_removed(i, removed)
+            tile.dirty = True
+        if tile.marks != marks:
+            tile.marks = marks
+            tile.dirty = True
+
+    def undo(self):
+        """Takes back the last edit. Returns False if there is none"""
+        deltas = self.history.undo()
+        if deltas is None:
+            return False
+        for i, old_value, _, old_marks, _, old_removed, _ in reversed(deltas):
+            self.put(i, old_value, old_marks, old_removed)
+        return True
 
-    def draw(self):
-        """Draws the initial board consisting of all the gridlines, 
-        tiles and initial values"""
+    def redo(self):
+        """Makes the last undone edit again. Returns False if there is none"""
+        deltas = self.history.redo()
+        if deltas is None:
+            return False
+        for i, _, new_value, _, new_marks, _, new_removed in deltas:
+            self.put(i, new_value, new_marks, new_removed)
+        return True
 
-        # Draw all the gridlines
+    def fits(self, row, col, value):
+        """Checks if a value can go in the empty tile at row and col
+        without repeating a digit in its row, column or box"""
+        return self.candidates.fits(row*self.ncols + col, value)
+
+    def save_state(self, mistakes, elapsed):
+        """Returns the game on this board as a SavedGame"""
+        return savegame.SavedGame(self.box, [value for row in self.board for value in row], list(self.cells),
+                                  [tile.marks for row in self.tiles for tile in row],
+                                  list(self.candidates.removed), mistakes, elapsed)
+
+    def restore(self, game):
+        """Fills in the values, sketches and removed candidates of a saved
+        game of the puzzle on this board"""
+        for i, value in enumerate(game.values):
+            self.set_value(i // self.ncols, i % self.ncols, value)
+
+        all_digits = self.candidates.layout.all_digits
+        for i, (marks, removed) in enumerate(zip(game.marks, game.removed)):
+            tile = self.tile(i)
+            tile.marks = marks & all_digits
+            tile.dirty = True
+            if self.cells[i] == 0:
+                for value in sudoku_solver.iter_digits(removed & all_digits):
+                    self.candidates.eliminate(i, value)
+
+    def fill_marks(self):
+        """Sketches all candidates in every empty tile"""
+        for i, mask in enumerate(self.candidates.masks):
+            tile = self.tile(i)
+            if self.cells[i] == 0 and tile.marks != mask:
+                tile.marks = mask
+                tile.dirty = True
+
+    def show_hint(self, hint):
+        """Outlines the tiles of a hint, or removes the outlines of the
+        hint that is shown if hint is None"""
+        if self.hint is not None:
+            for i in self.hint.cells + [i for i, _ in self.hint.eliminations]:
+                self.tile(i).set_highlight('hint', None)
+
+        self.hint = hint
+        if hint is not None:
+            for i, _ in hint.eliminations:
+                self.tile(i).set_highlight('hint', PURPLE)
+            for i in hint.cells:
+                self.tile(i).set_highlight('hint', ORANGE)
+
+    def apply_hint(self):
+        """Carries out the hint that is shown. A value is placed like a
+        correct guess and removed candidates are taken out of the sketches"""
+        hint = self.hint
+        self.show_hint(None)
+        changes = []
+        if hint.cell is not None:
+            changes.append((hint.cell, hint.value, 0, 0))
+
+        # The eliminations of a cell are grouped, a naked pair can remove two digits
+        removed = {}
+        for i, value in hint.eliminations:
+            removed[i] = removed.get(i, 0) | 1 << value
+        for i, bits in removed.items():
+            changes.append((i, self.cells[i], self.tile(i).marks & ~bits, self.candidates.removed[i] | bits))
+        self.change(changes)
+
+    def show_conflicts(self, value):
+        """Outlines in red the tiles in the row, column and box of the
+        selected empty tile that already hold value, None clears them"""
+        for i in self.conflicts:
+            self.tile(i).set_highlight('conflict', None)
+
+        self.conflicts = []
+        if value is not None and self.selected:
+            row, col = self.selected
+            i = row*self.ncols + col
+            if self.cells[i] == 0:
+                self.conflicts = self.candidates.conflicts(i, value)
+        for i in self.conflicts:
+            self.tile(i).set_highlight('conflict', RED)
+
+    def draw_grid(self, surface):
+        """Draws all the gridlines of the board"""
         for i in range(self.ncols + 1):
-            if i % 3 == 0 and i != 0 and i != 9:
+            if i % self.box == 0 and i != 0 and i != self.ncols:
                 linewidth = 5
             else:
                 linewidth = 2
-            pygame.draw.line(self.win, BLACK, (0, i*self.gap), (self.boardWidth, i*self.gap), linewidth)
-            pygame.draw.line(self.win, BLACK, (i*self.gap, 0), (i*self.gap, self.boardHeight), linewidth)
-                
-        # Draw the tiles and their values
+            pygame.draw.line(surface, BLACK, (0, i*self.gap), (self.boardWidth, i*self.gap), linewidth)
+            pygame.draw.line(surface, BLACK, (i*self.gap, 0), (i*self.gap, self.boardHeight), linewidth)
+
+    def draw(self, background):
+        """Redraws the tiles that changed since the last frame and returns
+        the screen areas that were updated"""
+        rects = []
         for tile in [i for row in self.tiles for i in row]:
-            tile.draw(self.win, self.select_color)
+            if tile.dirty:
+                tile.draw(self.win, background, self.select_color)
+                rects.append(tile.tile_rect)
+        return rects
+
+    def mark_dirty(self, rect=None):
+        """Marks all tiles, or only those overlapping rect, to be redrawn
+        in the next frame"""
+        for tile in [i for row in self.tiles for i in row]:
+            if rect is None or tile.tile_rect.colliderect(rect):
+                tile.dirty = True
+
+    def is_dirty(self, rect):
+        """Checks if any tile overlapping rect has to be redrawn"""
+        for tile in [i for row in self.tiles for i in row]:
+            if tile.dirty and tile.tile_rect.colliderect(rect):
+                return True
+        return False
+
+    def mark_selected_dirty(self):
+        """Marks the selected tile to be redrawn in the next frame"""
+        if self.selected:
+            row, col = self.selected
+            self.tiles[row][col].dirty = True
+
+    def set_select_color(self, color):
+        """Changes the color of the selection border"""
+        if self.select_color != color:
+            self.select_color = color
+            self.mark_selected_dirty()
 
     def set_selected(self, row, col):
         """Updates the selected status of the selected tile and 
@@ -136,10 +550,10 @@ class Board:
         # Reset all tiles to not selected
         for m in range(self.nrows):
             for n in range(self.ncols):
-                self.tiles[m][n].selected = False
+                self.tiles[m][n].set_selected(False)
 
         self.selected = (row, col)
-        self.tiles[row][col].selected = True
+        self.tiles[row][col].set_selected(True)
 
     def reset_selected(self):
         """Resets the selection of tiles to nothing selected"""
@@ -147,27 +561,27 @@ class Board:
         # Reset all tiles to not selected
         for m in range(self.nrows):
             for n in range(self.ncols):
-                self.tiles[m][n].selected = False
+                self.tiles[m][n].set_selected(False)
         
         self.selected = None
 
-    def move_selection(self, direction):
-        """Moves the selection box by input of a given arrow direction"""
+    def move_selection(self, direction, steps=1):
+        """Moves the selection box by input of a given arrow direction,
+        steps tiles at once"""
         row, col = self.selected
-        self.tiles[row][col].selected = False
+        self.tiles[row][col].set_selected(False)
 
         if direction == 'UP':
-            self.selected = ((row-1) % 9, col)
-            self.tiles[(row-1) % 9][col].selected = True
+            self.selected = ((row-steps) % self.nrows, col)
         elif direction == 'DOWN':
-            self.selected = ((row+1) % 9, col)
-            self.tiles[(row+1) % 9][col].selected = True
+            self.selected = ((row+steps) % self.nrows, col)
         elif direction == 'LEFT':
-            self.selected = (row, (col-1) % 9)
-            self.tiles[row][(col-1) % 9].selected = True
+            self.selected = (row, (col-steps) % self.ncols)
         elif direction == 'RIGHT':
-            self.selected = (row, (col+1) % 9)
-            self.tiles[row][(col+1) % 9].selected = True
+            self.selected = (row, (col+steps) % self.ncols)
+
+        row, col = self.selected
+        self.tiles[row][col].set_selected(True)
 
     def click_to_rowcol(self, pos):
         """Takes the x, y position of the click and returns a row and column value"""
@@ -184,108 +598,151 @@ class Board:
         """Checks if the given value is valid in the current tile and draws if true"""
         row, col = self.selected
         if self.tiles[row][col].value == 0:
-            self.tiles[row][col].set_val(value)
-            self.update_model()
+            solution = self.get_solution()
 
-            if valid_check(self.model, row, col, value) and self.solve():
+            # A guess is only valid if it matches the solution of the puzzle
+            if solution is not None and solution[row][col] == value:
+                self.edit(row, col, value, self.tiles[row][col].marks)
                 return True
             else:
-                self.tiles[row][col].set_val(0)
-                self.update_model()
                 return False
 
-    def solve(self):
-        """Solves the sudoku that is saved as the model by filling it in"""
-
-        # Find the next empty tile
-        next = next_empty(self.model)
-        if not next:
-            return True
-        else:
-            row, col = next
+    def get_solution(self):
+        """Returns the solution of the puzzle, solving it on the first call only.
+        Since only correct guesses end up in the model, solving the current
+        model always gives the solution of the original puzzle"""
+        if self.solution is None:
+            self.stats = sudoku_solver.SolverStats()
+            self.solution = sudoku_solver.solve(self.model, self.stats)
+        return self.solution
+
+    def solve(self, stats=None, backend='engine'):
+        """Solves the sudoku that is saved as the model by filling it in,
+        using one of the BACKENDS. Statistics of the search are collected
+        in stats if it is given"""
+        solution = BACKENDS[backend](self.model, stats)
+        if solution is None:
+            return False
 
-        # Backtracking algorithm
-        for val in range(1, 10):
-            if valid_check(self.model, row, col, val):
-                self.model[row][col] = val
+        for row, values in enumerate(solution):
+            for col, value in enumerate(values):
+                self.set_value(row, col, value)
+        return True
 
-                # Check if model is complete
-                if self.solve():
-                    return True
+    def solve_in_gui(self, stats=None):
+        """Generator that solves the Sudoku in the GUI one step at a time.
+        Every value that is tried is shown with a green border and every
+        value that is taken back with a red one. The search keeps an explicit
+        stack of empty tiles instead of recursing, so the caller decides how
+        many steps to take per frame and can stop at any time. Returns True
+        once solved, or False if the puzzle has no solution.
+        Statistics of the search are collected in stats if it is given"""
+
+        empty = [(m, n) for m in range(self.nrows) for n in range(self.ncols)
+                 if self.cells[m*self.ncols + n] == 0]
+
+        check = self.fits
+        if stats is not None:
+            check = timed_check(self.fits, stats)
+            resumed = time.perf_counter()
+
+        # i is the position on the stack of empty tiles
+        i = 0
+        try:
+            while i != len(empty):
+                if i < 0:
+                    return False
 
-                self.model[row][col] = 0
-        return False
+                row, col = empty[i]
+                tile = self.tiles[row][col]
+                val = self.cells[row*self.ncols + col]
+
+                # Take back the value that is in the tile now
+                if val != 0:
+                    self.set_value(row, col, 0)
+                    tile.set_highlight('solver', RED)
+                    if stats is not None:
+                        stats.backtracks += 1
+                        stats.total_time += time.perf_counter() - resumed
+                    yield
+                    if stats is not None:
+                        resumed = time.perf_counter()
+
+                # Backtracking algorithm, try the next valid value or go back one tile
+                for val in range(val + 1, self.nrows + 1):
+                    if check(row, col, val):
+                        self.set_value(row, col, val)
+                        tile.set_highlight('solver', GREEN)
+                        i += 1
+                        if stats is not None:
+                            stats.nodes += 1
+                            stats.max_depth = max(stats.max_depth, i)
+                            stats.total_time += time.perf_counter() - resumed
+                        yield
+                        if stats is not None:
+                            resumed = time.perf_counter()
+                        break
+                else:
+                    i -= 1
+
+        # Aborting the solve empties the tiles it filled in again
+        except GeneratorExit:
+            for row, col in empty:
+                self.set_value(row, col, 0)
+            raise
 
-    def solve_in_gui(self):
-        """Solves the Sudoku in the GUI"""
+        return True
 
-        self.update_model()
-        next = next_empty(self.model)
-        if not next:
-            return True
-        else:
-            row, col = next
-
-        # Backtracking algorithm with lines for drawing the tested values
-        for val in range(1, 10):
-            if valid_check(self.model, row, col, val):
-                self.model[row][col] = val
-                self.tiles[row][col].set_val(val)
-                self.tiles[row][col].draw_solvestep(self.win, GREEN)
-                self.update_model()
-                pygame.display.flip()
-                pygame.time.delay(10)
-
-                if self.solve_in_gui():
-                    return True
-
-                self.model[row][col] = 0
-                self.tiles[row][col].set_val(0)
-                self.update_model()
-                self.tiles[row][col].draw_solvestep(self.win, RED)
-                pygame.display.flip()
-                pygame.time.delay(10)
-        
-        return False   
+    def clear_highlights(self):
+        """Removes the borders left by the animated solver, along with those
+        of the hint and the conflicts that were shown"""
+        for tile in [i for row in self.tiles for i in row]:
+            if tile.borders:
+                tile.borders = {}
+                tile.dirty = True
+        self.hint = None
+        self.conflicts = []
 
     def check_finish(self):
         """Simple check to see if all empty grid places are gone"""
-        for i in range(self.nrows):
-            for j in range(self.ncols):
-                if self.tiles[i][j].value == 0:
-                    return False
-        return True
-
-def next_empty(board):
-    """Finds the next empty tile on the board"""
-    for i in range(len(board)):
-        for j in range(len(board[0])):
-            if board[i][j] == 0:
-                return (i, j)
-    return None
-
-def valid_check(board, row, col, value):
-    """Checks if the filled in solution value at a given row and column is valid"""
-
-    # Row check
-    for n in range(len(board[0])):
-        if board[row][n] == value and col != n:
-            return False
-        
-    # Column check
-    for m in range(len(board)):
-        if board[m][col] == value and row != m:
-            return False
-    
-    # Box check
-    box_x = col // 3
-    box_y = row // 3
-
-    for m in range(box_y*3, box_y*3 + 3):
-        for n in range(box_x * 3, box_x*3 + 3):
-            if board[m][n] == value and (m,n) != (row,col):
-                return False
-    
+        return self.empty == 0
+
+
+def timed_check(check, stats):
+    """Wraps a candidate check so that its calls and time are counted in stats"""
+    def timed(row, col, value):
+        start = time.perf_counter()
+        valid = check(row, col, value)
+        stats.candidates_tried += 1
+        stats.check_time += time.perf_counter() - start
+        return valid
+    return timed
+
+def stats_lines(stats):
+    """Turns solver statistics into the lines shown in the stats overlay"""
+    return (
+        f"Nodes:  {stats.nodes}",
+        f"Tried:  {stats.candidates_tried}",
+        f"Backtracks:  {stats.backtracks}",
+        f"Max depth:  {stats.max_depth}",
+        f"Check/search:  {stats.check_time*1000:.0f}/{stats.search_time*1000:.0f} ms",
+    )
+
+def run_solve_steps(steps, count):
+    """Advances the animated solve by count steps, or for about one frame
+    worth of time if count is None. Returns False once the solve is done"""
+    deadline = time.perf_counter() + 1 / FPS
+    taken = 0
+    try:
+        while count is None or taken < count:
+            next(steps)
+            taken += 1
+
+            # Checking the clock only every few steps keeps it cheap
+            if count is None and taken % 64 == 0 and time.perf_counter() > deadline:
+                break
+    except StopIteration:
+        return False
     return True
 
 def time_format(secs):
@@ -293,257 +750,677 @@ def time_format(secs):
     t = time.strftime("%M:%S", time.gmtime(secs))
     return t
 
-def generate_sudoku(rank):
-    """Generates a new 9x9 sudoku grid with a given rank"""
-    new_list = np.array(list(str(generators.random_sudoku(avg_rank=rank))), dtype=int)
-    new_grid = new_list.reshape(9,9)
-    return new_grid
-
-def draw_window(window, board, time, mistakes, finished):
-    """Draws the window and everything displayed on it"""
-    window.fill(WHITE)
-
-    # Draw the time box
-    timebox = pygame.Rect(720, 0, 270, 162)
-    pygame.draw.rect(window, BLACK, timebox, 2)
-    text = timefont.render(time_format(time), 1, BLACK)
-    text_rect = text.get_rect(center = timebox.center)
-    window.blit(text, text_rect)
-
-    # Draw the mistake box
-    errbox = pygame.Rect(720, 160, 270, 81)
-    pygame.draw.rect(window, BLACK, errbox, 2)
-    text = errfont.render(f"Mistakes:  {mistakes}", True, BLACK)
-    text_rect = text.get_rect(center = errbox.center)
-    window.blit(text, text_rect)
-
-    # Draw instructions box
+def is_proper_puzzle(grid):
+    """Checks that a puzzle has exactly one solution. Puzzles that take too
+    long to check are treated as broken"""
+    try:
+        return sudoku_solver.count_solutions(grid, limit=2, max_nodes=MAX_CHECK_NODES) == 1
+    except sudoku_solver.SearchLimitExceeded:
+        return False
+
+def library_puzzle(library, number):
+    """Returns puzzle number of a library and shows its number in the
+    window title, or returns None if its record is damaged or the puzzle
+    does not have exactly one solution"""
+    try:
+        grid = library[number]
+    except ValueError as error:
+        print(error)
+        return None
+    if not is_proper_puzzle(grid):
+        print(f"Puzzle {number + 1} of {library.path} does not have exactly one solution")
+        return None
+    pygame.display.set_caption(f"Sudokupy - puzzle {number + 1} of {len(library)}")
+    return grid
+
+def resume_game(path, box):
+    """Returns the game saved in path if it is for boxes of the given size,
+    or None if there is no usable saved game"""
+    try:
+        game = savegame.load_game(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        print(f"Could not resume the saved game: {error}")
+        return None
+    return game if game.box == box else None
+
+def key_code(name):
+    """Turns a key name such as 'page up' or 'ctrl+z' into a (key, ctrl
+    held) pair of the keymap. Raises ValueError for unknown keys"""
+    name = name.strip().lower()
+    ctrl = name.startswith('ctrl+') and len(name) > 5
+    if ctrl:
+        name = name[5:]
+    return pygame.key.key_code(name), ctrl
+
+def load_keymap(path=KEYS_FILE):
+    """Returns the keymap, (key, ctrl held) -> command, from DEFAULT_BINDINGS
+    and the bindings file at path if there is one. Every line of the file
+    binds a command to keys, such as 'guess = return, space', replacing
+    the default keys of that command. Keys bound in the file win over the
+    default keys of other commands. Lines starting with # are skipped"""
+    bindings = {}
+    if path is not None and os.path.exists(path):
+        with open(path) as file:
+            for number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                command, sep, names = line.partition('=')
+                command = command.strip()
+                if not sep or command not in DEFAULT_BINDINGS:
+                    print(f"{path}:{number}: unknown command {command!r}")
+                    continue
+                bindings[command] = [name for name in names.split(',') if name.strip()]
+
+    keymap = {}
+    defaults = {command: names for command, names in DEFAULT_BINDINGS.items() if command not in bindings}
+    for command, names in list(defaults.items()) + list(bindings.items()):
+        for name in names:
+            try:
+                keymap[key_code(name)] = command
+            except ValueError:
+                print(f"Unknown key {name.strip()!r} for {command}")
+    return keymap
+
+def queue_command(commands, command, arg=None):
+    """Adds a command to the commands of a frame as a [command, argument]
+    pair. Repeats of a move become one move over several tiles, so a held
+    arrow key costs one redraw per frame instead of one per repeat"""
+    if command in MOVES and commands and commands[-1][0] == command:
+        commands[-1][1] += 1
+    else:
+        commands.append([command, 1 if command in MOVES else arg])
+
+def wait_events(poll):
+    """Waits for events and returns them. The queue is checked every poll
+    ms, with a sleep in between. pygame.event.wait checks it every
+    millisecond, which costs more CPU than a whole idle game"""
+    events = pygame.event.get()
+    while not events:
+        pygame.time.wait(poll)
+        events = pygame.event.get()
+    return events
+
+def schedule_clock(elapsed):
+    """Sets a one-shot timer for the clock event just after the time box
+    has to show the next second, given the seconds played so far"""
+    pygame.time.set_timer(CLOCK_EVENT, int((1 - elapsed % 1)*1000) + 10, 1)
+
+def generate_sudoku(difficulty, box=3):
+    """Generates a new sudoku grid of a given difficulty, 9x9 unless the
+    boxes are made bigger or smaller than 3x3"""
+    return sudoku_generator.generate(difficulty=difficulty, box=box)
+
+def keys_label(keymap, commands):
+    """Returns the keys of the instruction panel for a row of commands, the
+    first key the keymap binds to every command. Rows of many commands,
+    such as the digits, show the keys of the first and the last one"""
+    names = {}
+    for (key, ctrl), command in keymap.items():
+        if command in commands and command not in names:
+            name = pygame.key.name(key)
+            name = KEY_LABELS.get(name, name.upper())
+            names[command] = f"Ctrl+{name}" if ctrl else name
+
+    labels = [names[command] for command in commands if command in names]
+    if not labels:
+        return "-"
+    if len(commands) > 4:
+        return f"{labels[0]}-{labels[-1]}"
+    if len(commands) > 2 and all(len(label) == 1 for label in labels):
+        return ''.join(labels)
+    return '/'.join(labels)
+
+def draw_background(window, board, keymap):
+    """Draws everything that never changes during a game (the gridlines,
+    box borders, instructions and the cat) to a cached background surface.
+    The instructions show the keys of the keymap"""
+    background = pygame.Surface(window.get_size()).convert()
+    background.fill(WHITE)
+
+    # Draw the time box and mistake box borders
+    pygame.draw.rect(background, BLACK, TIMEBOX, 2)
+    pygame.draw.rect(background, BLACK, ERRBOX, 2)
+
+    # Draw instructions box, with the keys the keymap binds to every command
     commbox = pygame.Rect(720, 239, 270, 323)
-    pygame.draw.rect(window, BLACK, commbox, 2)
-    
-    vbox1 = pygame.Rect(720, 239, 135, 280)
-    t1 = commfont.render(f"LMB  = ", True, BLACK)
-    t2 = commfont.render(f"↑↓→←  = ", True, BLACK)
-    t3 = commfont.render(f"NUM  = ", True, BLACK)
-    t4 = commfont.render(f"ENTER  = ", True, BLACK)
-    t5 = commfont.render(f"DEL  = ", True, BLACK)
-    t6 = commfont.render(f"R  = ", True, BLACK)
-    t7 = commfont.render(f"SPACE  = ", True, BLACK)
-    t8 = commfont.render(f"G  = ", True, BLACK)
-    t9 = commfont.render(f"ESC  = ", True, BLACK)
-
-    x1, y1 = vbox1.topright
-    x1 += 20
-    y1 += 3
-    window.blit(t1, t1.get_rect(topright=(x1, y1)))
-    window.blit(t2, t2.get_rect(topright=(x1, y1+35)))
-    window.blit(t3, t3.get_rect(topright=(x1, y1+70)))
-    window.blit(t4, t4.get_rect(topright=(x1, y1+105)))
-    window.blit(t5, t5.get_rect(topright=(x1, y1+140)))
-    window.blit(t6, t6.get_rect(topright=(x1, y1+175)))
-    window.blit(t7, t7.get_rect(topright=(x1, y1+210)))
-    window.blit(t8, t8.get_rect(topright=(x1, y1+245)))
-    window.blit(t9, t9.get_rect(topright=(x1, y1+280)))
-
-    vbox2 = pygame.Rect(855, 239, 135, 402)
-    p1 = commfont.render(f"select", True, BLACK)
-    p2 = commfont.render(f"select", True, BLACK)
-    p3 = commfont.render(f"sketch", True, BLACK)
-    p4 = commfont.render(f"guess", True, BLACK)
-    p5 = commfont.render(f"clear", True, BLACK)
-    p6 = commfont.render(f"restart", True, BLACK)
-    p7 = commfont.render(f"solve", True, BLACK)
-    p8 = commfont.render(f"new", True, BLACK)
-    p9 = commfont.render(f"quit", True, BLACK)
-   
-    x2, y2 = vbox2.topleft
-    x2 += 30
-    y2 += 3
-    window.blit(p1, p1.get_rect(topleft=(x2, y2)))
-    window.blit(p2, p2.get_rect(topleft=(x2, y2+35)))
-    window.blit(p3, p3.get_rect(topleft=(x2, y2+70)))
-    window.blit(p4, p4.get_rect(topleft=(x2, y2+105)))
-    window.blit(p5, p5.get_rect(topleft=(x2, y2+140)))
-    window.blit(p6, p6.get_rect(topleft=(x2, y2+175)))
-    window.blit(p7, p7.get_rect(topleft=(x2, y2+210)))
-    window.blit(p8, p8.get_rect(topleft=(x2, y2+245)))
-    window.blit(p9, p9.get_rect(topleft=(x2, y2+280)))
-
-    # Draw end screen
-    if finished:
-        endbox = pygame.Rect(990/4, 270, 500,150)
-        text = endfont.render("Well done!", True, BLACK)
-        text_rect = text.get_rect(center = endbox.center)
-        window.blit(text, text_rect)
+    pygame.draw.rect(background, BLACK, commbox, 2)
+
+    rows = [("LMB", "select")] + [(keys_label(keymap, commands), text) for commands, text in PANEL_ROWS]
+    height = (commbox.height - 6) // len(rows)
+    x, y = commbox.left + 135, commbox.top + 4
+    for keys, text in rows:
+        label = glyphs.render(panelfont, f"{keys}  = ", BLACK)
+        background.blit(label, label.get_rect(topright=(x + 20, y)))
+        label = glyphs.render(panelfont, text, BLACK)
+        background.blit(label, label.get_rect(topleft=(x + 30, y)))
+        y += height
 
     # Draw cat box
-    catbox = pygame.Rect(720, 560, 270, 162)
-    pygame.draw.rect(window, BLACK, catbox, 2)
-    catImg = pygame.image.load('moral_support_cat.png')
-    window.blit(catImg, catbox.topleft)
+    pygame.draw.rect(background, BLACK, CATBOX, 2)
+    catImg = assets.load_image(CAT_IMAGE, alpha=True)
+    background.blit(catImg, CATBOX[:2])
+
+    # Draw the gridlines of the board
+    board.draw_grid(background)
+
+    return background
 
-    # Draw the board
-    board.draw()
+class Renderer:
+    """Retained-mode renderer that keeps the static parts of the window on
+    a cached background and only redraws the parts that changed"""
 
-def main():
-    """Function that initialises the game"""
+    def __init__(self, window, board, keymap):
+        self.win = window
+        self.background = draw_background(window, board, keymap)
+        self.full_redraw = True             # redraw the whole window next frame
+        self.shown_time = None              # time text currently on screen
+        self.shown_mistakes = None          # mistake count currently on screen
+        self.shown_finished = False         # end screen currently on screen
+        self.shown_overlay = None           # overlay lines currently on screen
+
+    def invalidate(self):
+        """Forces the next frame to redraw the whole window"""
+        self.full_redraw = True
+
+    def draw_text_box(self, box, text):
+        """Clears the inside of a box and draws the text centered in it"""
+        inner = pygame.Rect(box).inflate(-4, -4)
+        self.win.blit(self.background, inner, inner)
+        self.win.blit(text, text.get_rect(center = inner.center))
+        return inner
+
+    def draw(self, board, time, mistakes, finished, overlay=None):
+        """Draws the parts of the window that changed and returns the
+        screen areas that have to be updated. The overlay lines, such as
+        solver statistics or a hint, are shown over the cat box if given"""
+        rects = []
+
+        if self.full_redraw:
+            self.win.blit(self.background, (0, 0))
+            board.mark_dirty()
+            self.shown_time = None
+            self.shown_mistakes = None
+            self.shown_finished = False
+            self.shown_overlay = None
+
+        # Draw the time box
+        time_text = time_format(time)
+        if time_text != self.shown_time:
+            text = glyphs.render(timefont, time_text, BLACK)
+            rects.append(self.draw_text_box(TIMEBOX, text))
+            self.shown_time = time_text
+
+        # Draw the mistake box
+        if mistakes != self.shown_mistakes:
+            text = glyphs.render(errfont, f"Mistakes:  {mistakes}", BLACK)
+            rects.append(self.draw_text_box(ERRBOX, text))
+            self.shown_mistakes = mistakes
+
+        # Draw the overlay, or the cat again once it is turned off
+        lines = None if overlay is None else tuple(overlay)
+        if lines != self.shown_overlay:
+            inner = pygame.Rect(CATBOX).inflate(-4, -4)
+            if lines is None:
+                self.win.blit(self.background, inner, inner)
+            else:
+                self.win.fill(WHITE, inner)
+                for n, line in enumerate(lines):
+                    text = glyphs.render(commfont, line, BLACK)
+                    self.win.blit(text, (inner.x + 10, inner.y + 4 + n*31))
+            rects.append(inner)
+            self.shown_overlay = lines
+
+        # The end screen is drawn on top of the board. When it has to be drawn
+        # again, all tiles under it are redrawn first so it is not blended twice
+        if finished:
+            text = glyphs.render(endfont, "Well done!", BLACK)
+            text_rect = text.get_rect(center = pygame.Rect(ENDBOX).center)
+            redraw_end = not self.shown_finished or board.is_dirty(text_rect)
+            if redraw_end:
+                board.mark_dirty(text_rect)
+
+        # Draw the board
+        rects.extend(board.draw(self.background))
+
+        if finished and redraw_end:
+            self.win.blit(text, text_rect)
+            rects.append(text_rect)
+            self.shown_finished = True
+
+        if self.full_redraw:
+            self.full_redraw = False
+            return [self.win.get_rect()]
+        return rects
+
+class Game:
+    """A game in the window: the board, the clock, the mistakes and the
+    animated solve, with a handler for every command in COMMANDS and
+    SOLVING_COMMANDS. Handlers take the command and its argument, the
+    number of tiles for moves and the position for clicks"""
+
+    def __init__(self, win, box=3, library=None, number=0, keymap=None):
+        self.win = win
+        self.keymap = load_keymap() if keymap is None else keymap   # (key, ctrl held) -> command
+        self.box = box
+        self.nrows = self.ncols = box*box
+        self.library = library              # PuzzleLibrary the puzzles come from, if any
+        self.number = number                # number of the library puzzle being played
+
+        # New puzzles are generated in the background so G does not have to wait,
+        # with a pool file per board size. The generator is started by main once
+        # the first frame is shown, so it does not hold up the start of the game
+        self.generate = functools.partial(generate_sudoku, box=box)
+        pool_file = POOL_FILE if box == 3 else POOL_FILE.replace('.txt', f'_{self.nrows}.txt')
+        self.pool = PuzzlePool(self.generate, [DIFFICULTY], path=pool_file)
+
+        # An unfinished game of the last session is carried on, unless a
+        # library puzzle was asked for. There is a save file per board size
+        self.save_file = SAVE_FILE if box == 3 else SAVE_FILE.replace('.sav', f'_{self.nrows}.sav')
+        saved = resume_game(self.save_file, box) if library is None else None
+        if saved is not None and not is_proper_puzzle(sudoku_generator.to_grid(saved.puzzle)):
+            print("Could not resume the saved game: its puzzle does not have exactly one solution")
+            saved = None
+
+        # Broken puzzles (no or several solutions) are replaced by a generated one
+        if saved is not None:
+            first_board = sudoku_generator.to_grid(saved.puzzle)
+        elif library is not None:
+            first_board = library_puzzle(library, number) or self.generate(DIFFICULTY)
+        elif box == 3 and is_proper_puzzle(init_board):
+            first_board = init_board
+        else:
+            first_board = self.pool_puzzle()
+        self.set_board(first_board)
+        self.renderer = Renderer(win, self.board, self.keymap)
+
+        if saved is not None:
+            self.board.restore(saved)
+            self.start -= saved.elapsed
+            self.mistakes = saved.mistakes
+
+        self.running = True
+        self.speed = 0                      # index into SOLVE_SPEEDS
+        self.paused = False
+        self.show_stats = False             # solver statistics over the cat box
+        self.visible = True                 # False while the window is hidden or minimized
+        self.shown_key = None
+        self.shown_conflict = None          # (selected tile, value) whose conflicts are outlined
+
+    def set_board(self, grid):
+        """Starts a new game on a puzzle"""
+        self.board = Board(self.win, grid, self.nrows, self.ncols, 720, 720)
+        self.start = time.time()
+        self.mistakes = 0
+        self.finished = False
+        self.end_time = None
+        self.solving = None                 # steps of the running animated solve
+        self.typed = None                   # (digit, time, tile it was sketched in) of a first digit
+        self.hint_text = None               # explanation of the hint over the cat box
+        self.clock_due = True               # the clock event has to be scheduled
+
+    def elapsed(self):
+        """Seconds played, which stop counting once the game is finished"""
+        return self.end_time if self.finished else time.time() - self.start
+
+    def check_finish(self):
+        """Ends the game once the board is full"""
+        if not self.finished and self.board.check_finish():
+            self.end_time = self.elapsed()
+            self.finished = True
+
+    def dispatch(self, command, arg):
+        """Carries out a command, if it does anything in the current mode"""
+        handler = (SOLVING_COMMANDS if self.solving is not None else COMMANDS).get(command)
+        if handler is None:
+            return
+
+        # Any other command puts the hint away again
+        self.board.set_select_color(BLUE)
+        if command not in ('hint', 'stats'):
+            self.board.show_hint(None)
+            self.hint_text = None
+        getattr(self, handler)(command, arg)
+
+    def move(self, command, steps):
+        """Moves the selection border, from the middle if nothing is selected"""
+        board = self.board
+        if not board.selected:
+            board.selected = (board.nrows // 2, board.ncols // 2)
+        board.move_selection(command.upper(), steps)
+        board.key = None
+
+    def digit(self, command, arg):
+        """Types a digit, which adds a temporary value to the selected tile"""
+        board = self.board
+        key = int(command)
+
+        # Values above 9 are typed as two digits in quick succession,
+        # which takes back the sketch value the first digit added
+        first = self.typed
+        self.typed = None
+        if first is not None and time.time() - first[1] < TWO_DIGIT_TIME \
+                and first[0]*10 + key <= board.nrows:
+            key = first[0]*10 + key
+            if first[2] is not None:
+                first[2].remove_temp(first[0])
+        elif key == 0 or key > board.nrows:
+            key = None
+        elif key*10 <= board.nrows:
+            # Remember the tile that gets a new sketch value from this digit
+            tile = None
+            if board.selected:
+                row, col = board.selected
+                if not board.tiles[row][col].marks & (1 << key):
+                    tile = board.tiles[row][col]
+            self.typed = (key, time.time(), tile)
+
+        board.key = key
+        if board.selected and key is not None:
+            row, col = board.selected
+            board.tiles[row][col].add_temp(key)
+
+    def guess(self, command, arg):
+        """Places the typed value in the selected tile if it is right"""
+        board = self.board
+        if not board.selected or board.key is None:
+            return
+
+        row, col = board.selected
+        if board.place_value(board.key):
+            board.set_select_color(GREEN)
+        else:
+            self.mistakes += 1
+            board.tiles[row][col].remove_temp(board.key)
+            board.set_select_color(RED)
+        board.key = None
+        self.check_finish()
+
+    def clear_marks(self, command, arg):
+        """Clears the selected tile of temporary values"""
+        if self.board.selected:
+            row, col = self.board.selected
+            self.board.edit(row, col, self.board.tiles[row][col].value, 0)
+            self.board.key = None
+
+    def erase_mark(self, command, arg):
+        """Removes the highest temporary value of the selected tile"""
+        if self.board.selected:
+            row, col = self.board.selected
+            tile = self.board.tiles[row][col]
+            if tile.marks:
+                self.board.edit(row, col, tile.value, tile.marks & ~(1 << tile.marks.bit_length() - 1))
+            self.board.key = None
+
+    def undo(self, command, arg):
+        """Takes back the last edit of the board: a placed value, sketched
+        or erased temporary values, a cleared tile, an auto-fill of the
+        sketches or an applied hint"""
+        if not self.finished:
+            self.board.undo()
+
+    def redo(self, command, arg):
+        """Makes the last undone edit again, which can finish the game when
+        it places the last value"""
+        if not self.finished:
+            self.board.redo()
+            self.check_finish()
+
+    def fill_marks(self, command, arg):
+        """Sketches every candidate in all empty tiles"""
+        self.board.fill_marks()
+
+    def hint(self, command, arg):
+        """The first press shows the next logical step, the second one carries it out"""
+        board = self.board
+        if self.finished:
+            return
+        if board.hint is not None:
+            board.apply_hint()
+            self.hint_text = None
+            self.check_finish()
+        else:
+            board.show_hint(board.candidates.next_step())
+            self.hint_text = board.hint.lines if board.hint else ["No simple step", "found, try a", "guess"]
+
+    def solve(self, command, arg):
+        """Starts the animated solve"""
+        self.board.gui_stats = sudoku_solver.SolverStats()
+        self.solving = self.board.solve_in_gui(self.board.gui_stats)
+        self.paused = False
+        self.board.key = None
+
+    def pause(self, command, arg):
+        self.paused = not self.paused
+
+    def faster(self, command, arg):
+        self.speed = min(self.speed + 1, len(SOLVE_SPEEDS) - 1)
+
+    def slower(self, command, arg):
+        self.speed = max(self.speed - 1, 0)
+
+    def abort(self, command, arg):
+        """Stops the animated solve, which empties the tiles it filled"""
+        self.solving.close()
+        self.solving = None
+        self.board.clear_highlights()
+
+    def toggle_stats(self, command, arg):
+        self.show_stats = not self.show_stats
+
+    def restart(self, command, arg):
+        self.set_board(self.board.board)
+        self.renderer.invalidate()
+
+    def new_game(self, command, arg):
+        """Starts a new puzzle, a random one of the library if there is one"""
+        if self.library is not None:
+            self.number = random.randrange(len(self.library))
+            self.open_puzzle()
+            return
+
+        self.set_board(self.pool_puzzle())
+        self.renderer.invalidate()
+
+    def pool_puzzle(self):
+        """Returns a puzzle from the pool, or a newly generated one if the
+        pool is empty. The pool file can be edited, so its puzzles are
+        checked for a unique solution"""
+        grid = self.pool.get(DIFFICULTY)
+        if grid is None or not is_proper_puzzle(grid):
+            grid = self.generate(DIFFICULTY)
+        return grid
+
+    def next_puzzle(self, command, arg):
+        if self.library is not None:
+            self.number = (self.number + 1) % len(self.library)
+            self.open_puzzle()
+
+    def previous_puzzle(self, command, arg):
+        if self.library is not None:
+            self.number = (self.number - 1) % len(self.library)
+            self.open_puzzle()
+
+    def open_puzzle(self):
+        """Starts the library puzzle of the current number"""
+        self.set_board(library_puzzle(self.library, self.number) or self.generate(DIFFICULTY))
+        self.renderer.invalidate()
+
+    def quit(self, command, arg):
+        self.running = False
+
+    def click(self, command, pos):
+        """Selects the tile under the mouse, or nothing if it is off the board"""
+        on_board = self.board.click_to_rowcol(pos)
+        if on_board != None:
+            self.board.set_selected(*on_board)
+        else:
+            self.board.reset_selected()
+        self.board.key = None
+
+    def set_visible(self, visible):
+        """Keeps track of whether the window can be seen. The clock is not
+        timed while it cannot, and the window is drawn in full once it shows"""
+        if visible and not self.visible:
+            self.renderer.invalidate()
+            self.clock_due = True
+        self.visible = visible
+
+    def animating(self):
+        """Checks if the animated solve needs new frames"""
+        return self.solving is not None and not self.paused
+
+    def step(self):
+        """Advances the animated solve by the number of steps of the current speed"""
+        if self.animating() and not run_solve_steps(self.solving, SOLVE_SPEEDS[self.speed]):
+            self.solving = None
+            self.board.clear_highlights()
+            self.check_finish()
+
+    def draw(self):
+        """Draws the parts of the window that changed and returns them"""
+        board = self.board
+
+        # The highlighted sketch value in the selected tile follows the key
+        if board.key != self.shown_key:
+            board.mark_selected_dirty()
+            self.shown_key = board.key
+
+        # Tiles that already hold the value being sketched are outlined in red
+        conflict = None if board.key is None else (board.selected, board.key)
+        if conflict != self.shown_conflict:
+            board.show_conflicts(None if conflict is None else board.key)
+            self.shown_conflict = conflict
+
+        # The overlay shows a hint, or the stats of the animated solve once it
+        # ran and those of the engine otherwise
+        overlay = self.hint_text
+        if overlay is None and self.show_stats:
+            board.get_solution()
+            overlay = stats_lines(board.gui_stats if board.gui_stats is not None else board.stats)
+
+        rects = self.renderer.draw(board, self.elapsed(), self.mistakes, self.finished, overlay)
+
+        # The clock event is timed again for the next second until the game
+        # ends, as long as the window can be seen
+        if self.clock_due and self.visible and not self.finished:
+            schedule_clock(self.elapsed())
+            self.clock_due = False
+        return rects
+
+    def close(self):
+        """Stops the puzzle pool and saves an unfinished game to carry on
+        with next time. A running animated solve is stopped first, so its
+        trial values are not saved as the values of the player. Library
+        puzzles are not saved, they would take the place of the saved game"""
+        self.pool.stop()
+        if self.solving is not None:
+            self.abort('quit', None)
+        if self.library is not None:
+            return
+        if not self.finished:
+            try:
+                savegame.save_game(self.save_file, self.board.save_state(self.mistakes, self.elapsed()))
+            except OSError as error:
+                print(f"Could not save the game: {error}")
+        elif os.path.exists(self.save_file):
+            os.remove(self.save_file)
+
+
+def main(box=3, library=None, number=0, keys_file=KEYS_FILE):
+    """Function that initialises the game, with a 9x9 board unless the
+    boxes are made bigger or smaller than 3x3. With a PuzzleLibrary the
+    game starts at puzzle number of the library and G, PAGE UP and
+    PAGE DOWN pick the puzzles from it. Key bindings are read from
+    keys_file if it exists"""
     wWidth  = 990
     wHeight = 721
-    bWidth  = 720
-    bHeight = 720
-    nrow = ncol = 9
 
     # Initializing the window, board and starting parameters
+    init_pygame()
     win = pygame.display.set_mode((wWidth, wHeight))
     pygame.display.set_caption("Sudokupy")
-    board = Board(win, init_board, nrow, ncol, bWidth, bHeight)
 
-    start   = time.time()
-    mistakes  = 0
-    finished = False
-    global key
-    key = None
+    # Images can only be converted once the display exists
+    assets.load_image(CAT_IMAGE, alpha=True)
+    print(assets.report())
 
-    running = True
-    while running:
+    game = Game(win, box, library, number, load_keymap(keys_file))
+    clock = pygame.time.Clock()
 
-        total_time = time.time() - start
+    first_frame = None                      # seconds from the start of the program to the first frame
+    frames = 0                              # frames drawn, for the frame rate report
+    latencies = []                          # seconds from reading input to showing its frame
+    started = time.perf_counter()
 
-        for event in pygame.event.get():
+    # The mouse position is never used, so moving it should not wake the loop
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
+    pygame.key.set_repeat(REPEAT_DELAY, REPEAT_INTERVAL)
 
-            if event.type == pygame.QUIT:
-                running = False
-
-            if event.type == pygame.KEYDOWN:
-                board.select_color = BLUE
-
-                if event.key == pygame.K_1 or event.key == pygame.K_KP1:
-                    key = 1
-                elif event.key == pygame.K_2 or event.key == pygame.K_KP2:
-                    key = 2
-                elif event.key == pygame.K_3 or event.key == pygame.K_KP3:
-                    key = 3
-                elif event.key == pygame.K_4 or event.key == pygame.K_KP4:
-                    key = 4
-                elif event.key == pygame.K_5 or event.key == pygame.K_KP5:
-                    key = 5
-                elif event.key == pygame.K_6 or event.key == pygame.K_KP6:
-                    key = 6
-                elif event.key == pygame.K_7 or event.key == pygame.K_KP7:
-                    key = 7
-                elif event.key == pygame.K_8 or event.key == pygame.K_KP8:
-                    key = 8
-                elif event.key == pygame.K_9 or event.key == pygame.K_KP9:
-                    key = 9
-                
-                elif event.key == pygame.K_UP:
-                    key = 'UP'
-                elif event.key == pygame.K_DOWN:
-                    key = 'DOWN'
-                elif event.key == pygame.K_LEFT:
-                    key = 'LEFT'
-                elif event.key == pygame.K_RIGHT:
-                    key = 'RIGHT'           
-
-                elif event.key == pygame.K_ESCAPE:
-                    running = False
-
-                elif event.key == pygame.K_SPACE:
-                    board.solve_in_gui()
-
-                    if board.check_finish():
-                        end_time = total_time
-                        finished = True
-
-                elif event.key == pygame.K_r:
-                    board = Board(win, board.board, nrow, ncol, bWidth, bHeight)
-                    start   = time.time()
-                    mistakes  = 0
-                    finished = False
-                    key = None
-                
-                elif event.key == pygame.K_g:
-                    new_board = generate_sudoku(100)
-                    board = Board(win, new_board, nrow, ncol, bWidth, bHeight)
-                    start   = time.time()
-                    mistakes  = 0
-                    finished = False
-                    key = None
-
-                elif event.key == pygame.K_RETURN and board.selected and type(key) == int:
-                    row, col = board.selected
-                    
-                    if board.place_value(key):
-                        board.select_color = GREEN
-                    else:
-                        mistakes += 1
-                        board.tiles[row][col].temp_values.remove(key)
-                        board.select_color = RED
-                    key = None
-
-                    # Game ends
-                    if board.check_finish():
-                        end_time = total_time
-                        finished = True
-                
-                # Adds a temporary value to the selected tile
-                if board.selected and type(key) == int:
-                    row, col = board.selected
-                    board.tiles[row][col].add_temp(key)
-
-                # Clears the selected tile of temporary values
-                if board.selected and event.key == pygame.K_DELETE:
-                    row, col = board.selected
-                    board.tiles[row][col].clear_temp()
-                    key = None
-
-                # Removes the last value added to temporary values
-                if board.selected and event.key == pygame.K_BACKSPACE:
-                    row, col = board.selected
-                    board.tiles[row][col].remove_temp()
-                    key = None
-
-                # Moves the selection border
-                if key in {'UP', 'DOWN', 'LEFT', 'RIGHT'}:
-                    if board.selected:
-                        board.move_selection(key)
-                        key = None
-                    else:
-                        board.selected = (4,4)
-                        board.move_selection(key)
-                        key = None
-
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                board.select_color = BLUE
-
-                # Left click
-                if event.button == 1:
-                    pos = event.pos
-                    on_board = board.click_to_rowcol(pos)
-                    
-                    # Selects a tile if click was on the board
-                    if on_board != None:
-                        board.set_selected(*on_board)
-                        key = None
-                    else:
-                        board.reset_selected()
-                        key = None
-
-        # Draw the window
-        if not finished:
-            draw_window(win, board, total_time, mistakes, finished)
-        else:
-            draw_window(win, board, end_time, mistakes, finished)
+    while game.running:
 
-        pygame.display.flip()
+        # Only the animated solve needs a new frame all the time. Otherwise the
+        # loop checks for input or the clock event of the time box every
+        # IDLE_POLL ms, or HIDDEN_POLL ms while the window cannot be seen. The
+        # clock event is not timed for finished games and hidden windows
+        if game.animating():
+            events = pygame.event.get()
+        else:
+            events = wait_events(IDLE_POLL if game.visible else HIDDEN_POLL)
+        received = time.perf_counter()
 
-# Some useful settings
-font = pygame.font.SysFont('lato', 50)
-tinyfont = pygame.font.SysFont('lato', 30)
-errfont = pygame.font.SysFont('lato', 40)
-timefont = pygame.font.SysFont('lato', 70)
-commfont = pygame.font.SysFont('lato', 30)
-endfont = pygame.font.SysFont('lato', 100)
+        # Input becomes a queue of commands through the keymap
+        commands = []
+        for event in events:
+            if event.type == pygame.QUIT:
+                game.running = False
+            elif event.type == CLOCK_EVENT:
+                game.clock_due = True
+            elif event.type in (pygame.WINDOWHIDDEN, pygame.WINDOWMINIMIZED):
+                game.set_visible(False)
+            elif event.type in (pygame.WINDOWSHOWN, pygame.WINDOWRESTORED):
+                game.set_visible(True)
+            elif event.type == pygame.KEYDOWN:
+                command = game.keymap.get((event.key, bool(event.mod & pygame.KMOD_CTRL)))
+                if command is not None:
+                    queue_command(commands, command)
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                queue_command(commands, 'click', event.pos)
+
+        for command, arg in commands:
+            game.dispatch(command, arg)
+        game.step()
+
+        # Draw only the parts of the window that changed, once it can be seen
+        rects = game.draw() if game.visible else []
+        if rects:
+            pygame.display.update(rects)
+            frames += 1
+        if commands:
+            latencies.append(time.perf_counter() - received)
+
+        if first_frame is None:
+            first_frame = time.perf_counter() - STARTED
+            print(f"First frame after {first_frame*1000:.0f} ms")
+            game.pool.start()
+
+        clock.tick(FPS)
+
+    game.close()
+    seconds = time.perf_counter() - started
+    print(f"Drew {frames} frames in {seconds:.1f} s ({frames / seconds:.1f} fps)")
+    if latencies:
+        latencies.sort()
+        print(f"Input to screen: p50 {latencies[len(latencies) // 2]*1000:.1f} ms, "
+              f"max {latencies[-1]*1000:.1f} ms over {len(latencies)} inputs")
+
+# Some useful settings, the fonts are loaded by init_pygame
+assets = Assets()
+errfont = timefont = commfont = panelfont = endfont = None
+glyphs = GlyphCache()
+CAT_IMAGE = 'moral_support_cat.png'
 
 # The initial board
 init_board = [
@@ -559,5 +1436,26 @@ init_board = [
 ]
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Sudoku game")
+    parser.add_argument('--size', type=int, choices=(4, 9, 16, 25),
+                        help="number of rows and columns of the board (default: 9, or that of the library)")
+    parser.add_argument('--library', help="file of puzzles to play, one per line or packed")
+    parser.add_argument('--puzzle', type=int, default=1, help="number of the library puzzle to start with (default: 1)")
+    parser.add_argument('--keys', default=KEYS_FILE, help="file with key bindings (default: keybindings.txt)")
+    args = parser.parse_args()
+
+    library = None
+    if args.library is not None:
+        try:
+            library = PuzzleLibrary(args.library)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+        if args.size is not None and args.size != library.size:
+            parser.error(f"--size {args.size} does not match the {library.size}x{library.size} puzzles of the library")
+        if not 1 <= args.puzzle <= len(library):
+            parser.error(f"--puzzle must be between 1 and {len(library)}")
+
+    size = args.size or (library.size if library is not None else 9)
+    main(int(round(size ** 0.5)), library, args.puzzle - 1, args.keys)
+    print(glyphs.report())
     pygame.quit()
\ No newline at end of file
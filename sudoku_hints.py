@@ -0,0 +1,197 @@
+## Live candidates and logical hints for the GUI
+#
+# Candidates keeps the candidate digits of every cell up to date while values
+# are placed and cleared. Every row, column and box keeps a count per digit, so
+# a change only looks at the peers of its cell (20 on a 9x9 grid) instead of
+# recomputing the whole grid. next_step finds the next step a person could take
+# from the candidates, trying the simplest techniques first.
+
+from sudoku_solver import layout, iter_digits
+
+# Names of the locked candidates steps by the number of cells they lock
+POINTING = {2: 'Pointing pair', 3: 'Pointing triple'}
+
+
+class Hint:
+    """A logical step: a value that can go in a cell, or candidates that
+    can be removed from other cells"""
+
+    def __init__(self, technique, lines, cells, cell=None, value=None, eliminations=()):
+        self.technique = technique          # name of the technique, such as 'Naked single'
+        self.lines = lines                  # short lines of text that explain the step
+        self.cells = cells                  # cells the step is based on
+        self.cell = cell                    # cell the value goes in, None for eliminations
+        self.value = value                  # digit placed by the step
+        self.eliminations = list(eliminations)  # (cell, digit) candidates the step removes
+
+
+class Candidates:
+    """Values and candidate digits of every cell of a grid with box x box
+    boxes. The candidates of an empty cell are the digits that are not in
+    its row, column or box yet, minus the ones removed by hints"""
+
+    def __init__(self, box=3):
+        tables = layout(box)
+        self.layout = tables
+        self.size = tables.size
+        self.stride = tables.size + 1       # digits 0 to size in the counts below
+        self.cells = bytearray(tables.ncells)   # values, row by row
+        self.counts = bytearray(len(tables.units)*self.stride)  # unit*stride + digit -> times the digit is in the unit
+        self.masks = [tables.all_digits]*tables.ncells  # candidates of every cell, 0 once it has a value
+        self.removed = [0]*tables.ncells    # candidates removed by hints, per cell
+        self.units_of = tables.units_of
+        self.peers = tables.peers
+
+    def fits(self, i, value):
+        """Checks if a value is not in the row, column or box of cell i yet"""
+        stride = self.stride
+        row, col, box = self.units_of[i]
+        return not (self.counts[row*stride + value] or self.counts[col*stride + value]
+                    or self.counts[box*stride + value])
+
+    def free(self, i):
+        """Returns the candidates of the empty cell i as a bitmask"""
+        mask = 0
+        for value in range(1, self.size + 1):
+            if self.fits(i, value):
+                mask |= 1 << value
+        return mask & ~self.removed[i]
+
+    def set(self, i, value):
+        """Sets the value of cell i, 0 to clear it, and updates the counts
+        and the candidates of its peers. Returns the old value"""
+        old = self.cells[i]
+        if old == value:
+            return old
+
+        stride = self.stride
+        for unit in self.units_of[i]:
+            if old:
+                self.counts[unit*stride + old] -= 1
+            if value:
+                self.counts[unit*stride + value] += 1
+        self.cells[i] = value
+        self.removed[i] = 0
+        self.masks[i] = 0 if value else self.free(i)
+
+        # The new value is no longer a candidate of the peers, while the old
+        # one can come back in peers that have no other copy of it nearby
+        cells, masks, removed = self.cells, self.masks, self.removed
+        for p in self.peers[i]:
+            if cells[p] == 0:
+                if value:
+                    masks[p] &= ~(1 << value)
+                if old and not removed[p] & (1 << old) and self.fits(p, old):
+                    masks[p] |= 1 << old
+        return old
+
+    def eliminate(self, i, value):
+        """Removes a candidate from cell i until the cell is set again"""
+        self.removed[i] |= 1 << value
+        self.masks[i] &= ~(1 << value)
+
+    def set_removed(self, i, removed):
+        """Sets the candidates of cell i removed by hints, as a bitmask"""
+        self.removed[i] = removed
+        if self.cells[i] == 0:
+            self.masks[i] = self.free(i)
+
+    def conflicts(self, i, value):
+        """Returns the peers of cell i that already hold value"""
+        return [p for p in self.peers[i] if self.cells[p] == value]
+
+    def cell_name(self, i):
+        """Name of a cell as shown to the player, such as r1c5"""
+        return f"r{self.layout.row_of[i] + 1}c{self.layout.col_of[i] + 1}"
+
+    def unit_name(self, unit):
+        """Name of a unit as shown to the player, such as row 1 or box 5"""
+        kind, number = divmod(unit, self.size)
+        return f"{('row', 'col', 'box')[kind]} {number + 1}"
+
+    def next_step(self):
+        """Returns a Hint for the simplest step that makes progress, or None
+        if none of the techniques applies"""
+        return (self.naked_single() or self.hidden_single() or self.locked_candidates()
+                or self.naked_pair())
+
+    def naked_single(self):
+        """A cell with a single candidate"""
+        for i, mask in enumerate(self.masks):
+            if mask and not mask & (mask - 1):
+                value = mask.bit_length() - 1
+                lines = ["Naked single:", f"{value} in {self.cell_name(i)}", "only candidate"]
+                return Hint('Naked single', lines, [i], i, value)
+        return None
+
+    def hidden_single(self):
+        """A digit with a single place left in a row, column or box"""
+        masks = self.masks
+        for unit, cells in enumerate(self.layout.units):
+            once = more = 0
+            for i in cells:
+                more |= once & masks[i]
+                once |= masks[i]
+            single = once & ~more
+            if single:
+                value = single.bit_length() - 1
+                i = next(i for i in cells if masks[i] & (1 << value))
+                lines = ["Hidden single:", f"{value} in {self.cell_name(i)}",
+                         f"only spot in {self.unit_name(unit)}"]
+                return Hint('Hidden single', lines, [i], i, value)
+        return None
+
+    def locked_candidates(self):
+        """A digit whose places in a box all lie in one row or column can
+        be removed from the rest of that line (pointing), and a digit whose
+        places in a line all lie in one box from the rest of the box (claiming)"""
+        tables = self.layout
+        masks = self.masks
+        size = self.size
+        for unit, cells in enumerate(tables.units):
+            for value in range(1, size + 1):
+                bit = 1 << value
+                spots = [i for i in cells if masks[i] & bit]
+                if len(spots) < 2:
+                    continue
+
+                # A box can point at a row or column, a row or column can claim a box
+                kinds = (0, 1) if unit >= 2*size else (2,)
+                for kind in kinds:
+                    other = tables.units_of[spots[0]][kind]
+                    if any(tables.units_of[i][kind] != other for i in spots):
+                        continue
+                    removed = [(i, value) for i in tables.units[other]
+                               if masks[i] & bit and i not in spots]
+                    if not removed:
+                        continue
+
+                    if kind == 2:
+                        name = 'Claiming'
+                    else:
+                        name = POINTING.get(len(spots), 'Pointing')
+                    lines = [f"{name}:", f"{value} of {self.unit_name(unit)}",
+                             f"is in {self.unit_name(other)}", f"-{value} from {len(removed)} cells"]
+                    return Hint(name, lines, spots, value=value, eliminations=removed)
+        return None
+
+    def naked_pair(self):
+        """Two cells of a unit with the same two candidates, which can be
+        removed from the other cells of the unit"""
+        masks = self.masks
+        for unit, cells in enumerate(self.layout.units):
+            pairs = {}
+            for i in cells:
+                mask = masks[i]
+                if mask and self.layout.count_bits(mask) == 2:
+                    if mask in pairs:
+                        pair = [pairs[mask], i]
+                        removed = [(j, value) for j in cells if j not in pair
+                                   for value in iter_digits(masks[j] & mask)]
+                        if removed:
+                            a, b = iter_digits(mask)
+                            lines = ["Naked pair:", f"{a} and {b} in {self.unit_name(unit)}",
+                                     f"-{a},{b} from {len({j for j, _ in removed})} cells"]
+                            return Hint('Naked pair', lines, pair, eliminations=removed)
+                    pairs[mask] = i
+        return None
@@ -0,0 +1,493 @@
+## Bitmask constraint-propagation solver shared by the GUI and the text solver
+
+import time
+
+def count_bits(mask):
+    """Returns the number of digits in a bitmask of any size"""
+    return bin(mask).count('1')
+
+
+class Layout:
+    """Lookup tables for the cells of a flattened grid made of box x box
+    boxes, so the grid has box*box rows, columns, boxes and digits.
+    Every digit d is stored as the bit 1 << d, so a set of digits fits in one int"""
+
+    def __init__(self, box):
+        size = box*box
+        self.box = box
+        self.size = size                    # digits, and cells per row, column and box
+        self.ncells = size*size
+        self.all_digits = (1 << (size + 1)) - 2
+
+        self.row_of = [i // size for i in range(self.ncells)]
+        self.col_of = [i % size for i in range(self.ncells)]
+        self.box_of = [(i // (size*box))*box + (i % size) // box for i in range(self.ncells)]
+
+        self.rows  = [[r*size + c for c in range(size)] for r in range(size)]
+        self.cols  = [[r*size + c for r in range(size)] for c in range(size)]
+        self.boxes = [[i for i in range(self.ncells) if self.box_of[i] == b] for b in range(size)]
+        self.units = self.rows + self.cols + self.boxes
+
+        # Units of every cell as indexes into units (row, column, box), and
+        # the peers of every cell, the other cells that share a unit with it
+        self.units_of = [(self.row_of[i], size + self.col_of[i], 2*size + self.box_of[i])
+                         for i in range(self.ncells)]
+        self.peers = [sorted(set(self.units[r] + self.units[c] + self.units[b]) - {i})
+                      for i, (r, c, b) in enumerate(self.units_of)]
+
+        # Row and column segments, the cells a line shares with a box, as
+        # line*box + position of the box along the line
+        self.rseg_of = [self.row_of[i]*box + self.col_of[i] // box for i in range(self.ncells)]
+        self.cseg_of = [self.col_of[i]*box + self.row_of[i] // box for i in range(self.ncells)]
+
+        # A lookup table is faster for 9 digits but would be too big for more
+        if size <= 9:
+            self.count_bits = [count_bits(m) for m in range(1 << (size + 1))].__getitem__
+        else:
+            self.count_bits = count_bits
+
+
+layouts = {}
+
+def layout(box):
+    """Returns the shared lookup tables for grids with box x box boxes"""
+    if box not in layouts:
+        layouts[box] = Layout(box)
+    return layouts[box]
+
+
+def box_size(grid):
+    """Returns the box size of a square grid of box*box rows of box*box
+    values, raises ValueError for grids of any other shape"""
+    size = len(grid)
+    box = int(round(size ** 0.5))
+    if box < 2 or box*box != size or any(len(row) != size for row in grid):
+        raise ValueError(f"Expected an n^2 x n^2 grid such as 9x9 or 16x16, got {size} rows")
+    return box
+
+
+def iter_digits(mask):
+    """Yields the digits contained in a bitmask in ascending order"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# Box-line reduction does not pay for itself on 9x9 grids, which singles solve
+# quickly, but on 16x16 grids and up it cuts the search several times over
+LOCKED_FROM_BOX = 4
+
+
+class SearchLimitExceeded(Exception):
+    """Raised when the search visits more nodes than it was allowed to"""
+
+
+def locked_segments(segs, box):
+    """Takes the candidates of every segment of the rows (or columns) of a
+    grid, as line*box + position of the box along the line, and returns
+    the digits that box-line reduction removes from every segment"""
+    size = box*box
+    removed = [0]*len(segs)
+    for first in range(0, size, box):
+        lines = range(first, first + box)
+
+        # A digit of a line in only one box is removed from the other lines of that box
+        for line in lines:
+            once = twice = 0
+            for k in range(box):
+                seg = segs[line*box + k]
+                twice |= once & seg
+                once |= seg
+            only = once & ~twice
+            for k in range(box):
+                claimed = segs[line*box + k] & only
+                if claimed:
+                    for other in lines:
+                        if other != line:
+                            removed[other*box + k] |= claimed
+
+        # A digit of a box in only one line is removed from the rest of that line
+        for k in range(box):
+            once = twice = 0
+            for line in lines:
+                seg = segs[line*box + k]
+                twice |= once & seg
+                once |= seg
+            only = once & ~twice
+            for line in lines:
+                pointing = segs[line*box + k] & only
+                if pointing:
+                    for other in range(box):
+                        if other != k:
+                            removed[line*box + other] |= pointing
+    return removed
+
+
+class Solver:
+    """Sudoku solver that keeps the used digits of every row, column and box
+    as bitmasks and updates them incrementally while searching. Works on
+    any grid of n^2 x n^2 cells, such as 4x4, 9x9, 16x16 or 25x25"""
+
+    def __init__(self, grid, max_nodes=None):
+        self.layout = layout(box_size(grid))
+        self.size = self.layout.size
+        self.all_digits = self.layout.all_digits
+        self.row_of = self.layout.row_of
+        self.col_of = self.layout.col_of
+        self.box_of = self.layout.box_of
+        self.cells = [int(value) for row in grid for value in row]
+
+        self.rows = [0]*self.size
+        self.cols = [0]*self.size
+        self.boxes = [0]*self.size
+        self.trail = []                     # placed cells, used to undo a branch
+        self.elim = [0]*len(self.cells)     # candidates removed by box-line reduction
+        self.elim_trail = []                # earlier elim masks of the ~i trail entries
+        self.cands = []                     # candidates of the empty cells after propagate
+        self.solution = None                # first solution found by the search
+        self.consistent = True              # False if the givens break a rule
+        self.nodes = 0                      # number of search nodes visited
+        self.max_nodes = float('inf') if max_nodes is None else max_nodes
+        self.locked = self.layout.box >= LOCKED_FROM_BOX  # use box-line reduction
+
+        row_of, col_of, box_of = self.row_of, self.col_of, self.box_of
+        for i, value in enumerate(self.cells):
+            if value == 0:
+                continue
+            if not 1 <= value <= self.size:
+                self.consistent = False
+                self.cells[i] = 0
+                continue
+            bit = 1 << value
+            if (self.rows[row_of[i]] | self.cols[col_of[i]] | self.boxes[box_of[i]]) & bit:
+                self.consistent = False
+            self.rows[row_of[i]] |= bit
+            self.cols[col_of[i]] |= bit
+            self.boxes[box_of[i]] |= bit
+
+    def candidates(self, i):
+        """Returns the bitmask of digits that can still go in cell i"""
+        return self.all_digits & ~(self.rows[self.row_of[i]] | self.cols[self.col_of[i]]
+                                   | self.boxes[self.box_of[i]] | self.elim[i])
+
+    def place(self, i, value):
+        """Fills cell i with a value and marks it as used in its row, column and box"""
+        bit = 1 << value
+        self.cells[i] = value
+        self.rows[self.row_of[i]] |= bit
+        self.cols[self.col_of[i]] |= bit
+        self.boxes[self.box_of[i]] |= bit
+        self.trail.append(i)
+
+    def eliminate(self, i, bits):
+        """Removes the candidates in bits from cell i until undone"""
+        self.elim_trail.append(self.elim[i])
+        self.elim[i] |= bits
+        self.trail.append(~i)
+
+    def undo(self, mark):
+        """Empties all cells placed and restores all candidates eliminated
+        since the trail had length mark"""
+        cells, trail = self.cells, self.trail
+        row_of, col_of, box_of = self.row_of, self.col_of, self.box_of
+        while len(trail) > mark:
+            i = trail.pop()
+            if i < 0:
+                self.elim[~i] = self.elim_trail.pop()
+                continue
+            bit = ~(1 << cells[i])
+            cells[i] = 0
+            self.rows[row_of[i]] &= bit
+            self.cols[col_of[i]] &= bit
+            self.boxes[box_of[i]] &= bit
+
+    def propagate(self):
+        """Fills in naked and hidden singles until none are left, using
+        box-line reduction once they run out on grids with locked set.
+        Returns False if the grid ran into a contradiction"""
+        cells, rows, cols, boxes, elim = self.cells, self.rows, self.cols, self.boxes, self.elim
+        row_of, col_of, box_of = self.row_of, self.col_of, self.box_of
+        peers, all_digits, ncells = self.layout.peers, self.all_digits, self.layout.ncells
+        place = self.place
+
+        # The candidates of every empty cell, kept up to date below as values
+        # are placed, and the cells down to one candidate waiting to be placed
+        self.cands = cands = [0]*ncells
+        singles = []
+        for i in range(ncells):
+            if cells[i] == 0:
+                cand = all_digits & ~(rows[row_of[i]] | cols[col_of[i]] | boxes[box_of[i]]
+                                      | elim[i])
+                if cand & (cand - 1) == 0:
+                    if cand == 0:
+                        return False
+                    singles.append(i)
+                cands[i] = cand
+
+        while True:
+            # Naked singles: a placed value is no candidate of its peers anymore
+            while singles:
+                i = singles.pop()
+                if cells[i]:
+                    continue
+                cand = cands[i]
+                if cand == 0:
+                    return False
+                place(i, cand.bit_length() - 1)
+                cands[i] = 0
+                for j in peers[i]:
+                    other = cands[j]
+                    if other & cand:
+                        other ^= cand
+                        if other == 0:
+                            return False
+                        cands[j] = other
+                        if other & (other - 1) == 0:
+                            singles.append(j)
+
+            # Hidden singles: digits that fit in only one cell of a unit. Filled
+            # cells have no candidates, the digits used by a unit are in its mask
+            for unit, used in zip(self.layout.units, rows + cols + boxes):
+                once = twice = 0
+                for i in unit:
+                    cand = cands[i]
+                    twice |= once & cand
+                    once |= cand
+
+                if (once | used) != all_digits:
+                    return False
+
+                hidden = once & ~twice
+                if hidden == 0:
+                    continue
+
+                for i in unit:
+                    bit = cands[i] & hidden
+                    if bit:
+                        if bit & (bit - 1):
+                            return False
+                        cands[i] = bit
+                        singles.append(i)
+
+            # Once the singles run out, box-line reduction can remove candidates
+            # that make new singles
+            if not singles and not (self.locked and self.lock_candidates(cands, singles)):
+                return True
+
+    def lock_candidates(self, cands, singles):
+        """Box-line reduction: a digit whose places in a box all lie in one
+        row or column is removed from the rest of that line, and a digit
+        whose places in a line all lie in one box from the rest of that box.
+        Updates the candidates of every empty cell in cands, adds the cells
+        left with one to singles. Returns True if any were eliminated"""
+        layout = self.layout
+        rseg_of, cseg_of = layout.rseg_of, layout.cseg_of
+        rsegs = [0]*len(layout.rows)*layout.box
+        csegs = rsegs[:]
+        empty = []
+        for i, cand in enumerate(cands):
+            if cand:
+                empty.append(i)
+                rsegs[rseg_of[i]] |= cand
+                csegs[cseg_of[i]] |= cand
+
+        rlocked = locked_segments(rsegs, layout.box)
+        clocked = locked_segments(csegs, layout.box)
+        found = False
+        for i in empty:
+            cand = cands[i]
+            hit = cand & (rlocked[rseg_of[i]] | clocked[cseg_of[i]])
+            if hit:
+                self.eliminate(i, hit)
+                cand ^= hit
+                cands[i] = cand
+                if cand & (cand - 1) == 0:
+                    singles.append(i)
+                found = True
+        return found
+
+    def choose_cell(self):
+        """Returns the empty cell with the fewest candidates after propagate
+        and its candidates, or (None, 0) when the grid is full. Ties between
+        cells with two candidates go to the one sharing a candidate with the
+        most peers that have two as well, as its guess settles more cells"""
+        cands, count_bits = self.cands, self.layout.count_bits
+        best, best_cand, best_count = None, 0, self.size + 1
+        pairs = [False]*len(cands)
+        for i, cand in enumerate(cands):
+            if cand:
+                count = count_bits(cand)
+                if count < best_count:
+                    best, best_cand, best_count = i, cand, count
+                if count == 2:
+                    pairs[i] = True
+        if best_count != 2:
+            return best, best_cand
+
+        peers, best_links = self.layout.peers, -1
+        for i, pair in enumerate(pairs):
+            if pair:
+                cand = cands[i]
+                links = sum(1 for j in peers[i] if pairs[j] and cands[j] & cand)
+                if links > best_links:
+                    best, best_cand, best_links = i, cand, links
+        return best, best_cand
+
+    def search(self, limit=1, depth=0):
+        """Depth first search over the propagated grid that stops once limit
+        solutions are found. Returns the number of solutions found and
+        copies the first one to self.solution. Raises SearchLimitExceeded
+        when more than max_nodes nodes are visited. depth is the number of
+        guesses above this node"""
+        self.count_node(depth)
+
+        mark = len(self.trail)
+        if not self.propagate():
+            self.undo(mark)
+            return 0
+
+        i, cand = self.choose_cell()
+        if i is None:
+            if self.solution is None:
+                self.solution = self.cells[:]
+            self.undo(mark)
+            return 1
+
+        found = 0
+        branch = len(self.trail)
+        for value in iter_digits(cand):
+            self.place(i, value)
+            found += self.search(limit - found, depth + 1)
+            self.undo(branch)
+            if found >= limit:
+                break
+            self.count_backtrack()
+
+        self.undo(mark)
+        return found
+
+    def count_node(self, depth):
+        """Counts a search node. Raises SearchLimitExceeded once more than
+        max_nodes nodes were visited"""
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise SearchLimitExceeded(f"Gave up after {self.max_nodes} search nodes")
+
+    def count_backtrack(self):
+        """Called for every guess that is taken back, does nothing here"""
+
+    def solve(self):
+        """Searches for a solution, returns True if one was found"""
+        return self.consistent and self.search(1) == 1
+
+    def count(self, limit=2):
+        """Counts the solutions of the grid, stopping at limit"""
+        if not self.consistent:
+            return 0
+        return self.search(limit)
+
+    def grid(self):
+        """Returns the solution found as a list of lists, one per row"""
+        size = self.size
+        return [self.solution[r*size : (r+1)*size] for r in range(size)]
+
+
+class SolverStats:
+    """Statistics of a search: nodes visited, candidate values tried, values
+    taken back again, the deepest level reached and the time spent checking
+    candidates versus the time spent in the search as a whole"""
+
+    def __init__(self):
+        self.nodes = 0
+        self.candidates_tried = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.check_time = 0.0               # seconds spent finding candidates
+        self.total_time = 0.0               # seconds spent solving in total
+
+    @property
+    def search_time(self):
+        """Seconds spent in the search itself, outside of candidate checks"""
+        return self.total_time - self.check_time
+
+    def as_dict(self):
+        """Returns the statistics as a plain dictionary"""
+        return {
+            'nodes': self.nodes,
+            'candidates_tried': self.candidates_tried,
+            'backtracks': self.backtracks,
+            'max_depth': self.max_depth,
+            'check_time': self.check_time,
+            'search_time': self.search_time,
+        }
+
+
+class InstrumentedSolver(Solver):
+    """Solver that records SolverStats while it searches. The counting and
+    timing only live in this subclass, which hooks into the search of
+    Solver through count_node and count_backtrack"""
+
+    def __init__(self, grid, max_nodes=None, stats=None):
+        super().__init__(grid, max_nodes)
+        self.stats = SolverStats() if stats is None else stats
+
+    def propagate(self):
+        start = time.perf_counter()
+        try:
+            return super().propagate()
+        finally:
+            self.stats.check_time += time.perf_counter() - start
+
+    def choose_cell(self):
+        start = time.perf_counter()
+        try:
+            return super().choose_cell()
+        finally:
+            self.stats.check_time += time.perf_counter() - start
+
+    def count_node(self, depth):
+        super().count_node(depth)
+        stats = self.stats
+        stats.nodes += 1
+        stats.max_depth = max(stats.max_depth, depth)
+        if depth:
+            stats.candidates_tried += 1
+
+    def count_backtrack(self):
+        self.stats.backtracks += 1
+
+    def count(self, limit=2):
+        start = time.perf_counter()
+        try:
+            return super().count(limit)
+        finally:
+            self.stats.total_time += time.perf_counter() - start
+
+    def solve(self):
+        start = time.perf_counter()
+        try:
+            return super().solve()
+        finally:
+            self.stats.total_time += time.perf_counter() - start
+
+
+def solve(grid, stats=None):
+    """Returns the solution of a grid as a list of lists, or None if
+    the grid has no solution. The input grid is left untouched. Passing a
+    SolverStats object collects statistics of the search in it.
+
+    Puzzles with a unique solution always give that solution. For grids
+    with several solutions any one of them may be returned."""
+    solver = Solver(grid) if stats is None else InstrumentedSolver(grid, stats=stats)
+    if solver.solve():
+        return solver.grid()
+    return None
+
+
+def count_solutions(grid, limit=2, max_nodes=None):
+    """Returns the number of solutions of a grid, counting no further
+    than limit. Grids whose givens break a rule return 0 straight away and
+    propagation cuts off most dead ends early. max_nodes bounds the search
+    time; SearchLimitExceeded is raised when the search needs more nodes"""
+    return Solver(grid, max_nodes).count(limit)